@@ -0,0 +1,390 @@
+"""
+Seeded benchmark suite of Selection, OrderedGene, non dominated sorts, crowding distance, batch fitness and generate
+of the examples, swept over population sizes and problem sizes. results are saved as JSON and can be compared with an
+earlier run. old implementations replaced by faster ones are kept as reference cases to compare with.
+
+run from repository root:
+    python -m Benchmarks.suite --output baseline.json
+    python -m Benchmarks.suite --output current.json --compare baseline.json --threshold 0.2
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import timeit
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from Genetic.MultiObjectiveAlgorithms import GeneWrapper, crowding_distance_assignment, \
+    efficient_non_dominated_sort, fast_non_dominated_sort, vectorized_non_dominated_sort
+from Genetic.SingleObjectiveAlgorithms import OrderedGene, Selection
+
+# sizes swept by every group, quick is for a check in a minute or so.
+SIZES = {
+    'quick': {
+        'selection': [100, 1000],
+        'ordered': [100, 1000],
+        'sorting': [(100, 2), (500, 3)],
+        'crowding': [100, 1000],
+        'fitness_tsp': [(1000, 50)],
+        'fitness_schaffer': [1000],
+        'tsp': [(100, 50), (500, 100)],
+        'schaffer': [100, 500],
+        'floor_planning': [(100, 10), (200, 30)],
+    },
+    'full': {
+        'selection': [100, 1000, 10000, 100000],
+        'ordered': [100, 1000, 10000],
+        'sorting': [(100, 2), (1000, 2), (1000, 3), (2000, 3)],
+        'crowding': [100, 1000, 10000],
+        'fitness_tsp': [(1000, 50), (1000, 500), (10000, 100)],
+        'fitness_schaffer': [1000, 100000],
+        'tsp': [(100, 50), (1000, 100), (1000, 500)],
+        'schaffer': [100, 1000, 2000],
+        'floor_planning': [(100, 10), (500, 30), (1000, 100)],
+    },
+}
+# reference implementations are quadratic, they are left out of larger sizes.
+REFERENCE_LIMIT = 10000
+
+
+class Case:
+    """ A benchmark: setup builds its input (seeded) and returns the function to time."""
+
+    def __init__(self, name: str, params: dict, setup: Callable[[], Callable[[], object]]):
+        """
+        Create a benchmark case.
+
+        :param name: name of benchmark, like 'selection.roulette_wheel'.
+        :param params: sizes of benchmark.
+        :param setup: function returning a function without arguments to time.
+        """
+        self.name = name
+        self.params = params
+        self.setup = setup
+
+    def key(self) -> str:
+        """
+        get key identifying case across runs.
+
+        :return: key.
+        """
+        return get_key(self.name, self.params)
+
+
+def get_key(name: str, params: dict) -> str:
+    return name + "[" + ",".join("{}={}".format(k, v) for k, v in sorted(params.items())) + "]"
+
+
+def seed_all(seed: int) -> None:
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def reference_tournament(tournament_size: int) -> Callable:
+    # old tournament rebuilding list of indices for every selection.
+    def tournament_inner(population, fitness, selection_size):
+        selected = []
+        for i in range(selection_size):
+            tournament_list = random.choices(list(range(len(population))), k=tournament_size)
+            winner = population[tournament_list[0]]
+            max_fitness = fitness[tournament_list[0]]
+            for j in tournament_list:
+                if fitness[j] >= max_fitness:
+                    max_fitness = fitness[j]
+                    winner = population[j]
+            selected.append(winner)
+        return selected
+
+    return tournament_inner
+
+
+def reference_single_point(parent_a, parent_b, items):
+    # old single point crossover using list membership.
+    x = random.randint(0, len(items))
+    child_a = parent_a[:x]
+    child_b = parent_b[:x]
+    for i in parent_b:
+        if i not in child_a:
+            child_a.append(i)
+    for i in parent_a:
+        if i not in child_b:
+            child_b.append(i)
+    return child_a, child_b
+
+
+def get_selection_cases(sizes: List[int]) -> List[Case]:
+    selections = {
+        'proportionate': Selection.proportionate,
+        'roulette_wheel': Selection.roulette_wheel,
+        'alias': Selection.alias,
+        'stochastic_universal': Selection.stochastic_universal,
+        'ranked': Selection.ranked,
+        'tournament': Selection.get_tournament(5),
+        'vectorized_tournament': Selection.get_vectorized_tournament(5),
+        'reference_tournament': reference_tournament(5),
+    }
+    cases = []
+    for name, select_func in selections.items():
+        for size in sizes:
+            if name.startswith('reference') and size > REFERENCE_LIMIT:
+                continue
+            def setup(select_func=select_func, size=size):
+                population = list(range(size))
+                fitness = [random.random() for _ in population]
+                total = sum(fitness)
+                fitness = [i / total for i in fitness]
+                return lambda: select_func(population, fitness, size)
+            cases.append(Case('selection.' + name, {'population_size': size}, setup))
+    return cases
+
+
+def get_ordered_cases(sizes: List[int]) -> List[Case]:
+    crossovers = {
+        'single_point': OrderedGene.Crossover.single_point,
+        'order': OrderedGene.Crossover.order,
+        'partially_mapped': OrderedGene.Crossover.partially_mapped,
+        'cycle': OrderedGene.Crossover.cycle,
+        'edge_recombination': OrderedGene.Crossover.edge_recombination,
+        'reference_single_point': reference_single_point,
+    }
+    cases = []
+    for name, crossover in crossovers.items():
+        for size in sizes:
+            if name.startswith('reference') and size > REFERENCE_LIMIT:
+                continue
+            def setup(crossover=crossover, size=size):
+                items = list(range(size))
+                parent_a = random.sample(items, size)
+                parent_b = random.sample(items, size)
+                return lambda: crossover(parent_a, parent_b, items)
+            cases.append(Case('ordered.crossover.' + name, {'length': size}, setup))
+    for size in sizes:
+        def setup(size=size):
+            gene = random.sample(range(size), size)
+            # a mutation is too quick to time alone.
+            return lambda: [OrderedGene.Mutate.single_swap(gene) for _ in range(1000)]
+        cases.append(Case('ordered.mutate.single_swap_x1000', {'length': size}, setup))
+    return cases
+
+
+def get_wrappers(size: int, objectives: int) -> List[GeneWrapper]:
+    # integer fitness, so there are ties and many fronts as in real populations.
+    fitness = np.random.randint(0, max(size // 4, 2), size=(size, objectives)).tolist()
+    return [GeneWrapper(None, i) for i in fitness]
+
+
+def get_sorting_cases(sizes: List[tuple]) -> List[Case]:
+    sorts = {
+        'fast_non_dominated_sort': fast_non_dominated_sort,
+        'vectorized_non_dominated_sort': vectorized_non_dominated_sort,
+        'efficient_non_dominated_sort': efficient_non_dominated_sort,
+    }
+    cases = []
+    for name, sort_func in sorts.items():
+        for size, objectives in sizes:
+            def setup(sort_func=sort_func, size=size, objectives=objectives):
+                wrappers = get_wrappers(size, objectives)
+                return lambda: sort_func(wrappers)
+            cases.append(Case('sorting.' + name, {'population_size': size, 'objectives': objectives}, setup))
+    return cases
+
+
+def get_crowding_cases(sizes: List[int]) -> List[Case]:
+    cases = []
+    for size in sizes:
+        def setup(size=size):
+            front = get_wrappers(size, 2)
+            return lambda: crowding_distance_assignment(front)
+        cases.append(Case('crowding.crowding_distance_assignment', {'front_size': size, 'objectives': 2}, setup))
+    return cases
+
+
+def get_fitness_cases(sizes: dict) -> List[Case]:
+    from Example_Schaffers_Study.Schaffer import SchafferGene
+    from Example_TSP.TSP import City, Path
+
+    def get_tsp_genes(size, city_count):
+        Path.cities = [City(random.uniform(0, 1000), random.uniform(0, 1000)) for _ in range(city_count)]
+        Path.calculate_distances()
+        return [Path.create_random() for _ in range(size)]
+
+    cases = []
+    for size, city_count in sizes['fitness_tsp']:
+        params = {'population_size': size, 'city_count': city_count}
+
+        def setup_single(size=size, city_count=city_count):
+            genes = get_tsp_genes(size, city_count)
+            return lambda: [i.calculate_fitness() for i in genes]
+
+        def setup_batch(size=size, city_count=city_count):
+            genes = get_tsp_genes(size, city_count)
+            return lambda: Path.calculate_fitness_batch(genes)
+        cases.append(Case('fitness.tsp.single', params, setup_single))
+        cases.append(Case('fitness.tsp.batch', params, setup_batch))
+    for size in sizes['fitness_schaffer']:
+        def setup_single(size=size):
+            genes = [SchafferGene.create_random() for _ in range(size)]
+            return lambda: [i.calculate_fitness() for i in genes]
+
+        def setup_batch(size=size):
+            genes = [SchafferGene.create_random() for _ in range(size)]
+            return lambda: SchafferGene.calculate_fitness_batch(genes)
+        cases.append(Case('fitness.schaffer.single', {'population_size': size}, setup_single))
+        cases.append(Case('fitness.schaffer.batch', {'population_size': size}, setup_batch))
+    return cases
+
+
+def get_generate_setup(make_pool: Callable[[], object]) -> Callable[[], Callable[[], object]]:
+    def setup():
+        pool = make_pool()
+        pool.initialize_population()
+        return pool.generate
+    return setup
+
+
+def get_generate_cases(sizes: dict) -> List[Case]:
+    from Example_Floor_planning.Floor_planning import get_random_floor_plan_pool
+    from Example_Schaffers_Study.Schaffer import get_schaffer_pool
+    from Example_TSP.TSP import get_random_tsp_pool
+
+    cases = []
+    for size, city_count in sizes['tsp']:
+        cases.append(Case('generate.tsp', {'population_size': size, 'city_count': city_count},
+                          get_generate_setup(lambda size=size, city_count=city_count:
+                                             get_random_tsp_pool(size, city_count))))
+    for size in sizes['schaffer']:
+        cases.append(Case('generate.schaffer', {'population_size': size},
+                          get_generate_setup(lambda size=size: get_schaffer_pool(size))))
+    for size, block_count in sizes['floor_planning']:
+        cases.append(Case('generate.floor_planning', {'population_size': size, 'block_count': block_count},
+                          get_generate_setup(lambda size=size, block_count=block_count:
+                                             get_random_floor_plan_pool(size, block_count))))
+    return cases
+
+
+def get_cases(profile: str = 'quick') -> List[Case]:
+    """
+    get all benchmark cases of a size profile.
+
+    :param profile: 'quick' or 'full'.
+    :return: list of cases.
+    """
+    sizes = SIZES[profile]
+    return (get_selection_cases(sizes['selection']) + get_ordered_cases(sizes['ordered']) +
+            get_sorting_cases(sizes['sorting']) + get_crowding_cases(sizes['crowding']) +
+            get_fitness_cases(sizes) + get_generate_cases(sizes))
+
+
+def run_case(case: Case, seed: int, repeat: int) -> dict:
+    """
+    time a case, seeding random and numpy before setup so inputs are same in every run.
+
+    :param case: benchmark case.
+    :param seed: seed.
+    :param repeat: number of timed calls.
+    :return: result with best, median and mean seconds.
+    """
+    seed_all(seed)
+    func = case.setup()
+    times = sorted(timeit.repeat(func, number=1, repeat=repeat))
+    return {
+        'name': case.name,
+        'params': case.params,
+        'best': times[0],
+        'median': times[len(times) // 2],
+        'mean': sum(times) / len(times),
+        'repeat': repeat,
+    }
+
+
+def run_suite(profile: str = 'quick', seed: int = 0, repeat: int = 5, pattern: Optional[str] = None,
+              verbose: bool = True) -> dict:
+    """
+    run benchmark suite.
+
+    :param profile: 'quick' or 'full'.
+    :param seed: seed of every case.
+    :param repeat: number of timed calls of every case.
+    :param pattern: run only cases whose name contains pattern.
+    :param verbose: print every result.
+    :return: results with details of machine.
+    """
+    results = []
+    for case in get_cases(profile):
+        if pattern and pattern not in case.name:
+            continue
+        result = run_case(case, seed, repeat)
+        results.append(result)
+        if verbose:
+            print("{:<80} {:>11.6f}s".format(case.key(), result['best']))
+    return {
+        'meta': {
+            'profile': profile,
+            'seed': seed,
+            'repeat': repeat,
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.1, statistic: str = 'best') -> List[tuple]:
+    """
+    compare results with baseline, a case is a regression if it got slower by more than threshold.
+
+    :param current: results of this run.
+    :param baseline: results of an earlier run.
+    :param threshold: allowed slow down as a fraction (0.1 is 10%).
+    :param statistic: 'best', 'median' or 'mean'.
+    :return: list of (key, baseline seconds, current seconds, ratio, is regression) of cases in both runs.
+    """
+    old = {get_key(i['name'], i['params']): i[statistic] for i in baseline['results']}
+    rows = []
+    for result in current['results']:
+        key = get_key(result['name'], result['params'])
+        if key in old:
+            ratio = result[statistic] / old[key] if old[key] else float('inf')
+            rows.append((key, old[key], result[statistic], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="run seeded benchmark suite.")
+    parser.add_argument('--profile', choices=sorted(SIZES), default='quick')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--filter', help="run only benchmarks whose name contains this")
+    parser.add_argument('--output', help="path of JSON results")
+    parser.add_argument('--compare', help="path of JSON results of an earlier run")
+    parser.add_argument('--threshold', type=float, default=0.1, help="allowed slow down, 0.1 is 10%%")
+    parser.add_argument('--statistic', choices=['best', 'median', 'mean'], default='best')
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.profile, args.seed, args.repeat, args.filter)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.threshold, args.statistic)
+        print()
+        print("{:<80} {:>12} {:>12} {:>8}".format("benchmark", "baseline", "current", "ratio"))
+        for key, old, new, ratio, regression in rows:
+            print("{:<80} {:>11.6f}s {:>11.6f}s {:>7.2f}x{}".format(key, old, new, ratio,
+                                                                  "  REGRESSION" if regression else ""))
+        regressions = sum(i[4] for i in rows)
+        print("{} of {} benchmarks regressed by more than {:.0%}".format(regressions, len(rows), args.threshold))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,19 +1,287 @@
 from Genetic.MultiObjectiveAlgorithms import *
 import random
+from array import array
+from itertools import chain
+
+import numpy as np
+
+
+class SlicingTree:
+    """
+    Structure of a Polish expression (postfix) of a slicing floor plan: children and parent of every position.
+    It depends only on which positions hold operators, so plans keep it through operator flips, operand swaps
+    and crossover (which only moves operands).
+    """
+
+    def __init__(self, tree):
+        n = len(tree)
+        self.left = [-1] * n
+        self.right = [-1] * n
+        self.parent = [-1] * n
+        self.operands = []  # positions of blocks in order.
+        stack = []
+        for i, node in enumerate(tree):
+            if node in Plan.codes:
+                self.right[i] = stack.pop()
+                self.left[i] = stack.pop()
+                self.parent[self.left[i]] = i
+                self.parent[self.right[i]] = i
+            else:
+                self.operands.append(i)
+            stack.append(i)
+
+
+def calculate_shapes(trees, blocks):
+    """
+    bounding shape of every subtree of many integer encoded plans at once (H=-1, V=-2, blocks >= 0).
+    all plans are walked column by column with one stack per plan.
+
+    :param trees: (P x L) int array of plans.
+    :param blocks: (B x 2) array of breadth and height of blocks.
+    :return: (P x L) arrays of breadth and height of subtree ending at every position, and of left and right
+             child of every position (-1 for blocks).
+    """
+    count, length = trees.shape
+    rows = np.arange(count)
+    block_breadths = np.asarray(blocks[:, 0])
+    block_heights = np.asarray(blocks[:, 1])
+    breadths = np.zeros((count, length), dtype=blocks.dtype)
+    heights = np.zeros((count, length), dtype=blocks.dtype)
+    # stack holds positions of subtrees not yet joined, so shapes are read from breadths and heights.
+    stack = np.zeros((count, length + 1), dtype=np.int64)
+    top = np.zeros(count, dtype=np.int64)  # number of positions in stack of every plan.
+    lefts = np.full((count, length), -1, dtype=np.int64)
+    rights = np.full((count, length), -1, dtype=np.int64)
+    for j in range(length):
+        code = trees[:, j]
+        is_block = code >= 0
+        l = stack[rows, np.maximum(top - 2, 0)]
+        r = stack[rows, np.maximum(top - 1, 0)]
+        l_b, r_b = breadths[rows, l], breadths[rows, r]
+        l_h, r_h = heights[rows, l], heights[rows, r]
+        is_h = code == Plan.codes['H']
+        b = np.where(is_h, np.maximum(l_b, r_b), l_b + r_b)
+        h = np.where(is_h, l_h + r_h, np.maximum(l_h, r_h))
+        block = np.maximum(code, 0)
+        breadths[:, j] = np.where(is_block, block_breadths[block], b)
+        heights[:, j] = np.where(is_block, block_heights[block], h)
+        lefts[:, j] = np.where(is_block, -1, l)
+        rights[:, j] = np.where(is_block, -1, r)
+        top += np.where(is_block, 1, -1)
+        stack[rows, top - 1] = j
+    return breadths, heights, lefts, rights
+
+
+def calculate_centers(trees, blocks, breadths, heights, lefts, rights):
+    """
+    place blocks of many integer encoded plans at once, from root down column by column.
+    H stacks right subtree above left one, V puts it beside left one.
+
+    :param trees: (P x L) int array of plans.
+    :param blocks: (B x 2) array of breadth and height of blocks.
+    :param breadths: (P x L) breadth of subtrees, from calculate_shapes.
+    :param heights: (P x L) height of subtrees.
+    :param lefts: (P x L) left child of positions.
+    :param rights: (P x L) right child of positions.
+    :return: (P x B x 2) array of twice the center of every block (integer when sides are).
+    """
+    count, length = trees.shape
+    x = np.zeros((count, length), dtype=breadths.dtype)
+    y = np.zeros((count, length), dtype=heights.dtype)
+    for j in range(length - 1, -1, -1):
+        rows = np.flatnonzero(trees[:, j] < 0)
+        if not len(rows):
+            continue
+        l, r = lefts[rows, j], rights[rows, j]
+        is_h = trees[rows, j] == Plan.codes['H']
+        x[rows, l] = x[rows, j]
+        y[rows, l] = y[rows, j]
+        x[rows, r] = x[rows, j] + np.where(is_h, 0, breadths[rows, l])
+        y[rows, r] = y[rows, j] + np.where(is_h, heights[rows, l], 0)
+    plans, positions = np.nonzero(trees >= 0)
+    placed = trees[plans, positions]
+    centers = np.zeros((count, len(blocks), 2), dtype=np.float64)
+    centers[plans, placed, 0] = 2 * x[plans, positions] + blocks[placed, 0]
+    centers[plans, placed, 1] = 2 * y[plans, positions] + blocks[placed, 1]
+    return centers
+
+
+def concatenate_ranges(starts, ends):
+    """
+    concatenation of ranges start to end (exclusive), without a python loop.
+
+    :param starts: array of starts.
+    :param ends: array of ends.
+    :return: array of concatenated ranges.
+    """
+    counts = ends - starts
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    # every element is start of its range plus its position in the range.
+    shifts = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return shifts + np.arange(total)
+
+
+class NetIndex:
+    """
+    Nets grouped by number of pins as (nets x pins) arrays of blocks, and incidence of blocks (block -> nets) as
+    compressed rows, for vectorized half perimeter wirelength (HPWL) of all nets or only of nets touching
+    moved blocks.
+    """
+
+    def __init__(self, nets, block_count):
+        nets = [i for i in nets if len(i)]
+        sizes = np.array([len(i) for i in nets], dtype=np.int64)
+        self.count = len(nets)
+        # group and row in group of every net.
+        self.group_of = np.zeros(self.count, dtype=np.int64)
+        self.row_of = np.zeros(self.count, dtype=np.int64)
+        self.groups = []  # (nets, pins) with pins a (nets x size) array of blocks.
+        for g, size in enumerate(np.unique(sizes).tolist()):
+            members = np.flatnonzero(sizes == size)
+            self.group_of[members] = g
+            self.row_of[members] = np.arange(len(members))
+            pins = np.array([nets[i] for i in members.tolist()], dtype=np.int64).reshape(len(members), size)
+            self.groups.append((members, pins))
+        pins = np.fromiter(chain.from_iterable(nets), dtype=np.int64, count=int(sizes.sum()))
+        net_of_pin = np.repeat(np.arange(self.count), sizes)
+        by_block = np.argsort(pins, kind='stable')
+        self.block_nets = net_of_pin[by_block]
+        self.block_offsets = np.searchsorted(pins[by_block], np.arange(block_count + 1))
+
+    def nets_of(self, blocks) -> np.ndarray:
+        """
+        nets with a pin on any of blocks.
+
+        :param blocks: array of blocks.
+        :return: sorted array of nets.
+        """
+        return np.unique(self.block_nets[concatenate_ranges(self.block_offsets[blocks],
+                                                            self.block_offsets[blocks + 1])])
+
+    def wirelengths(self, centers, nets=None) -> np.ndarray:
+        """
+        half perimeter of bounding box of pins of every net.
+
+        :param centers: (B x 2) or (P x B x 2) centers of blocks.
+        :param nets: array of nets to measure, None measures all nets.
+        :return: (N) or (P x N) array of wirelengths in same order as nets.
+        """
+        if nets is None:
+            lengths = np.zeros(centers.shape[:-2] + (self.count,), dtype=centers.dtype)
+            for members, pins in self.groups:
+                lengths[..., members] = self.hpwl(centers, pins)
+            return lengths
+        lengths = np.zeros(centers.shape[:-2] + (len(nets),), dtype=centers.dtype)
+        groups = self.group_of[nets]
+        for g, (members, pins) in enumerate(self.groups):
+            mask = groups == g
+            lengths[..., mask] = self.hpwl(centers, pins[self.row_of[nets[mask]]])
+        return lengths
+
+    @staticmethod
+    def hpwl(centers, pins) -> np.ndarray:
+        """
+        half perimeter wirelength of nets of same number of pins.
+
+        :param centers: (B x 2) or (P x B x 2) centers of blocks.
+        :param pins: (N x size) array of blocks of nets.
+        :return: (N) or (P x N) array of wirelengths.
+        """
+        if pins.shape[1] == 2:
+            return np.abs(centers[..., pins[:, 0], :] - centers[..., pins[:, 1], :]).sum(axis=-1)
+        coordinates = centers[..., pins, :]
+        return (coordinates.max(axis=-2) - coordinates.min(axis=-2)).sum(axis=-1)
+
+
+def combine_curves(operator, left, right):
+    """
+    shape curve of a slicing (Stockmeyer): non dominated (breadth, height) of joining every shape of left with
+    every shape of right, found by walking both curves once. curves are sorted by increasing breadth (so
+    decreasing height) and every shape keeps index of shapes of left and right it is made of.
+
+    :param operator: 'H' (right above left) or 'V' (right beside left).
+    :param left: shape curve of left subtree, list of (breadth, height, left index, right index).
+    :param right: shape curve of right subtree.
+    :return: shape curve.
+    """
+    curve = []
+    if operator == 'V':
+        # breadths add up, only the taller side can lower height.
+        i, j = 0, 0
+        while i < len(left) and j < len(right):
+            h = max(left[i][1], right[j][1])
+            if not curve or h < curve[-1][1]:
+                curve.append((left[i][0] + right[j][0], h, i, j))
+            if left[i][1] > right[j][1]:
+                i += 1
+            elif right[j][1] > left[i][1]:
+                j += 1
+            else:
+                i += 1
+                j += 1
+    else:
+        # heights add up, walk from widest shapes and only the wider side can lower breadth.
+        i, j = len(left) - 1, len(right) - 1
+        while i >= 0 and j >= 0:
+            b = max(left[i][0], right[j][0])
+            if not curve or b < curve[-1][0]:
+                curve.append((b, left[i][1] + right[j][1], i, j))
+            if left[i][0] > right[j][0]:
+                i -= 1
+            elif right[j][0] > left[i][0]:
+                j -= 1
+            else:
+                i -= 1
+                j -= 1
+        curve.reverse()
+    return curve
 
 
 class Plan(Gene):
     blocks = []
     nets = []
+    # operators in integer encoding of tree.
+    codes = {'H': -1, 'V': -2}
+    operators = {-1: 'H', -2: 'V'}
+    net_index = None
+    net_index_key = None
+    # rotatable[i] tells if block i may be turned by 90 degrees when shape curves are used.
+    rotatable = []
+    # evaluate with shape curves (Stockmeyer), giving minimum area over rotations of blocks.
+    shape_curves = False
 
     @classmethod
-    def add_block(cls, breadth, height):
+    def add_block(cls, breadth, height, rotatable=True):
         cls.blocks.append((breadth, height))
+        cls.rotatable.append(rotatable)
+
+    @classmethod
+    def use_shape_curves(cls, enabled=True):
+        # set before plans are evaluated, cached shapes of existing plans are not recalculated.
+        cls.shape_curves = enabled
+
+    @classmethod
+    def get_block_curve(cls, block):
+        b, h = cls.blocks[block]
+        if b == h or not (block < len(cls.rotatable) and cls.rotatable[block]):
+            return [(b, h, -1, -1)]
+        return [(min(b, h), max(b, h), -1, -1), (max(b, h), min(b, h), -1, -1)]
 
     @classmethod
     def add_net(cls, block_a, block_b):
         cls.nets.append((block_a, block_b))
 
+    @classmethod
+    def get_net_index(cls) -> NetIndex:
+        # rebuilt when blocks or nets were added or replaced.
+        key = (id(cls.nets), len(cls.nets), len(cls.blocks))
+        if cls.net_index_key != key:
+            cls.net_index = NetIndex(cls.nets, len(cls.blocks))
+            cls.net_index_key = key
+        return cls.net_index
+
     @classmethod
     def create_random(cls) -> 'Plan':
         block_bag = list(range(len(cls.blocks)))
@@ -48,70 +316,256 @@ class Plan(Gene):
                 bag_ind += 1
         return Plan(tree)
 
-    def __init__(self, tree):
+    def __init__(self, tree, structure=None):
         self.tree = tree
+        self.structure = structure
+        # bounding shape of subtree ending at every position, None until calculated.
+        self.breadths = None
+        self.heights = None
+        # shape curve of subtree ending at every position, when shape curves are used.
+        self.curves = None
+        # twice the center of every block and total wirelength, None until calculated.
+        self.centers = None
+        self.wirelength = None
+
+    def get_structure(self) -> SlicingTree:
+        if self.structure is None:
+            self.structure = SlicingTree(self.tree)
+        return self.structure
+
+    def __getstate__(self):
+        # shapes are cheaper to recalculate than to send to worker processes.
+        state = self.__dict__.copy()
+        state['breadths'] = state['heights'] = state['curves'] = state['centers'] = state['wirelength'] = None
+        return state
+
+    def calculate_shapes(self) -> None:
+        if Plan.shape_curves:
+            self.calculate_curves()
+            self.realize()
+            return
+        breadths = []
+        heights = []
+        stack = []  # positions of subtrees not yet joined.
+        for i, node in enumerate(self.tree):
+            if node == 'H':
+                r = stack.pop()
+                l = stack.pop()
+                breadths.append(max(breadths[l], breadths[r]))
+                heights.append(heights[l] + heights[r])
+            elif node == 'V':
+                r = stack.pop()
+                l = stack.pop()
+                breadths.append(breadths[l] + breadths[r])
+                heights.append(max(heights[l], heights[r]))
+            else:
+                b, h = Plan.blocks[node]
+                breadths.append(b)
+                heights.append(h)
+            stack.append(i)
+        self.breadths = breadths
+        self.heights = heights
+
+    def calculate_curves(self) -> None:
+        curves = []
+        stack = []
+        for i, node in enumerate(self.tree):
+            if node in Plan.codes:
+                r = stack.pop()
+                l = stack.pop()
+                curves.append(combine_curves(node, curves[l], curves[r]))
+            else:
+                curves.append(Plan.get_block_curve(node))
+            stack.append(i)
+        self.curves = curves
+
+    def update_curves(self, i) -> None:
+        # recalculate shape curves from position i up to root.
+        structure = self.get_structure()
+        while i != -1:
+            node = self.tree[i]
+            if node in Plan.codes:
+                curve = combine_curves(node, self.curves[structure.left[i]], self.curves[structure.right[i]])
+            else:
+                curve = Plan.get_block_curve(node)
+            if curve == self.curves[i]:
+                return
+            self.curves[i] = curve
+            i = structure.parent[i]
+
+    def realize(self) -> None:
+        # pick shape of least area at root and follow it down, giving shape of every subtree and block.
+        structure = self.get_structure()
+        curves = self.curves
+        n = len(self.tree)
+        chosen = [0] * n
+        root = curves[-1]
+        chosen[-1] = min(range(len(root)), key=lambda k: root[k][0] * root[k][1])
+        breadths = [0] * n
+        heights = [0] * n
+        for i in range(n - 1, -1, -1):
+            b, h, l, r = curves[i][chosen[i]]
+            breadths[i], heights[i] = b, h
+            if l != -1:
+                chosen[structure.left[i]] = l
+                chosen[structure.right[i]] = r
+        self.breadths = breadths
+        self.heights = heights
+
+    def calculate_centers(self) -> np.ndarray:
+        # origins of subtrees from root down, parents come after their children in postfix order.
+        structure = self.get_structure()
+        breadths, heights = self.breadths, self.heights
+        n = len(self.tree)
+        x = [0] * n
+        y = [0] * n
+        centers = [(0, 0)] * len(Plan.blocks)
+        for i in range(n - 1, -1, -1):
+            node = self.tree[i]
+            if node == 'H':
+                l, r = structure.left[i], structure.right[i]
+                x[l] = x[r] = x[i]
+                y[l] = y[i]
+                y[r] = y[i] + heights[l]
+            elif node == 'V':
+                l, r = structure.left[i], structure.right[i]
+                y[l] = y[r] = y[i]
+                x[l] = x[i]
+                x[r] = x[i] + breadths[l]
+            else:
+                # shape of block at its position, it may be rotated.
+                centers[node] = (2 * x[i] + breadths[i], 2 * y[i] + heights[i])
+        return np.array(centers, dtype=np.float64).reshape(len(Plan.blocks), 2)
+
+    def calculate_wirelength(self) -> None:
+        self.centers = self.calculate_centers()
+        self.wirelength = float(Plan.get_net_index().wirelengths(self.centers).sum())
+
+    def update_wirelength(self) -> None:
+        # only nets with a pin on a moved block change.
+        centers = self.calculate_centers()
+        moved = np.flatnonzero((centers != self.centers).any(axis=1))
+        if len(moved):
+            index = Plan.get_net_index()
+            nets = index.nets_of(moved)
+            self.wirelength += float(index.wirelengths(centers, nets).sum() - index.wirelengths(self.centers, nets).sum())
+        self.centers = centers
+
+    def update_shapes(self, i) -> None:
+        # recalculate shapes from position i up to root, stopping where a shape did not change.
+        structure = self.get_structure()
+        breadths, heights = self.breadths, self.heights
+        while i != -1:
+            node = self.tree[i]
+            if node == 'H':
+                l, r = structure.left[i], structure.right[i]
+                shape = max(breadths[l], breadths[r]), heights[l] + heights[r]
+            elif node == 'V':
+                l, r = structure.left[i], structure.right[i]
+                shape = breadths[l] + breadths[r], max(heights[l], heights[r])
+            else:
+                shape = Plan.blocks[node]
+            if shape == (breadths[i], heights[i]):
+                return
+            breadths[i], heights[i] = shape
+            i = structure.parent[i]
 
     def mutate(self) -> None:
         a = random.randint(0, len(self.tree) - 1)
         if self.tree[a] == 'H':
             self.tree[a] = 'V'
+            changed = [a]
         elif self.tree[a] == 'V':
             self.tree[a] = 'H'
+            changed = [a]
         else:
             a = random.randint(1, len(Plan.blocks)-1)
             b = random.randint(a+1, len(Plan.blocks))
-            c = 0
-            x, y = 0, 0
-            bag = set(range(len(Plan.blocks)))
-            for i in range(len(self.tree)):
-                if self.tree[i] in bag:
-                    c += 1
-                    if c == a:
-                        x = i
-                    if c == b:
-                        y = i
+            operands = self.get_structure().operands
+            x, y = operands[a - 1], operands[b - 1]
             self.tree[x], self.tree[y] = self.tree[y], self.tree[x]
+            changed = [x, y]
+        if self.breadths is not None:
+            if self.curves is not None:
+                for i in changed:
+                    self.update_curves(i)
+                self.realize()
+            else:
+                for i in changed:
+                    self.update_shapes(i)
+            if self.centers is not None:
+                self.update_wirelength()
+        else:
+            self.centers = self.wirelength = None
 
     @staticmethod
     def crossover(parent_a: 'Plan', parent_b: 'Plan') -> ('Plan', 'Plan'):
+        # every child keeps structure of a parent and takes order of blocks from the other.
+        structure_a = parent_a.get_structure()
+        structure_b = parent_b.get_structure()
         child_a = parent_a.tree[:]
         child_b = parent_b.tree[:]
-        a_ind = 0
-        b_ind = 0
-        bag = set(range(len(Plan.blocks)))
-        for i in parent_b.tree:
-            if i in bag:
-                while a_ind < len(child_a) and (child_a[a_ind] not in bag):
-                    a_ind += 1
-                if a_ind >= len(child_a):
-                    break
-                child_a[a_ind] = i
-                a_ind += 1
-        for i in parent_a.tree:
-            if i in bag:
-                while b_ind < len(child_b) and child_b[b_ind] not in bag:
-                    b_ind += 1
-                if b_ind >= len(child_b):
-                    break
-                child_b[b_ind] = i
-                b_ind += 1
-        return Plan(child_a), Plan(child_b)
+        for i, j in zip(structure_a.operands, structure_b.operands):
+            child_a[i] = parent_b.tree[j]
+            child_b[j] = parent_a.tree[i]
+        return Plan(child_a, structure_a), Plan(child_b, structure_b)
+
+    def fitness_key(self) -> Hashable:
+        return tuple(self.tree)
+
+    def encode(self) -> bytes:
+        return array('i', [Plan.codes.get(i, i) for i in self.tree]).tobytes()
+
+    @classmethod
+    def decode(cls, data: bytes) -> 'Plan':
+        tree = array('i')
+        tree.frombytes(data)
+        return Plan([Plan.operators.get(i, i) for i in tree])
 
     def calculate_fitness(self) -> List[float]:
-        stack = []
-        bag = set(range(len(Plan.blocks)))
-        for i in self.tree:
-            if i in bag:
-                stack.append(Plan.blocks[i])
-            elif i == 'H':
-                x_b, x_h = stack.pop()
-                y_b, y_h = stack.pop()
-                stack.append((max(x_b, y_b), x_h + y_h))
-            elif i == 'V':
-                x_b, x_h = stack.pop()
-                y_b, y_h = stack.pop()
-                stack.append((x_b + y_b, max(x_h, y_h)))
-        b, h = stack[0]
-        area = b * h
-        delay = 0
-        return [area, delay]
+        if self.breadths is None:
+            self.calculate_shapes()
+        if self.wirelength is None:
+            self.calculate_wirelength()
+        area = self.breadths[-1] * self.heights[-1]
+        # centers are doubled, so is wirelength. both objectives are minimized.
+        return [-area, -self.wirelength / 2]
+
+    @classmethod
+    def encode_trees(cls, genes) -> np.ndarray:
+        # all trees have same length, 2 * blocks - 1.
+        length = len(genes[0].tree) if genes else 0
+        codes = chain.from_iterable(map(cls.codes.get, gene.tree, gene.tree) for gene in genes)
+        return np.fromiter(codes, dtype=np.int32, count=len(genes) * length).reshape(len(genes), length)
+
+    @classmethod
+    def calculate_fitness_batch(cls, genes) -> List[List[float]]:
+        # shape curves differ in length between plans, so they are not batched.
+        if cls.shape_curves or len({len(i.tree) for i in genes}) > 1:
+            return [i.calculate_fitness() for i in genes]
+        # genes with shapes and wirelength kept up to date by mutate need no walk.
+        missing = [i for i in genes if i.breadths is None or i.wirelength is None]
+        if missing:
+            trees = cls.encode_trees(missing)
+            blocks = np.array(cls.blocks).reshape(len(cls.blocks), 2)
+            breadths, heights, lefts, rights = calculate_shapes(trees, blocks)
+            centers = calculate_centers(trees, blocks, breadths, heights, lefts, rights)
+            wirelengths = cls.get_net_index().wirelengths(centers).sum(axis=1)
+            for k, gene in enumerate(missing):
+                gene.breadths, gene.heights = breadths[k].tolist(), heights[k].tolist()
+                gene.centers, gene.wirelength = centers[k], float(wirelengths[k])
+        return [i.calculate_fitness() for i in genes]
+
+
+def get_random_floor_plan_pool(population_size=100, block_count=20, seed=0, net_count=None, shape_curves=False):
+    # random blocks with sides from 1 to 10 and nets between random pairs of blocks, for headless runs.
+    rng = random.Random(seed)
+    Plan.blocks = []
+    Plan.nets = []
+    Plan.rotatable = []
+    Plan.use_shape_curves(shape_curves)
+    for i in range(block_count):
+        Plan.add_block(rng.randint(1, 10), rng.randint(1, 10))
+    for i in range(block_count if net_count is None else net_count):
+        Plan.add_net(*rng.sample(range(block_count), 2))
+    return NonDominatedGenePool(Plan, population_size, mutation_rate=0.1, crossover_rate=0.8, tournament_fraction=0.1)
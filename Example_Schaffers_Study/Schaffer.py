@@ -1,6 +1,9 @@
 from Genetic.MultiObjectiveAlgorithms import *
 import random
 import math
+import struct
+
+import numpy as np
 
 
 class SchafferGene(Gene):
@@ -24,9 +27,24 @@ class SchafferGene(Gene):
         r = random.randint(1, 10)
         return SchafferGene(parent_a.x+int(r*diff)), SchafferGene(parent_a.x+int((10-r)*diff))
 
+    def fitness_key(self) -> Hashable:
+        return self.x
+
+    def encode(self) -> bytes:
+        return struct.pack('<q', self.x)
+
+    @classmethod
+    def decode(cls, data: bytes) -> 'SchafferGene':
+        return SchafferGene(struct.unpack('<q', data)[0])
+
     def calculate_fitness(self) -> List[float]:
         return [-math.pow(self.x, 2), -math.pow(self.x-2, 2)]
 
+    @classmethod
+    def calculate_fitness_batch(cls, genes) -> List[List[float]]:
+        x = np.array([i.x for i in genes], dtype=float)
+        return np.stack([-np.square(x), -np.square(x - 2)], axis=1).tolist()
+
 
 def get_schaffer_pool(population_size):
     return NonDominatedGenePool(SchafferGene, population_size, mutation_rate=0.1, crossover_rate=0.8, tournament_fraction=0.1)
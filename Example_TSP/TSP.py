@@ -1,6 +1,10 @@
 from Genetic.SingleObjectiveAlgorithms import *
+from Genetic.Populations import PermutationArray
 import random
 import math
+from collections import OrderedDict, deque
+
+import numpy as np
 
 
 class City:
@@ -13,35 +17,266 @@ class City:
         return math.sqrt(math.pow(A.x - B.x, 2) + math.pow(A.y - B.y, 2))
 
 
+def nearest_neighbours(coordinates, k):
+    """
+    k nearest neighbours of every point using a uniform grid index.
+    cells hold about 2 points, and rings of cells around a cell are searched until k neighbours are found
+    within the searched radius, so result is exact.
+
+    :param coordinates: (n x 2) array of points.
+    :param k: number of neighbours.
+    :return: (n x k) int32 array of neighbours of every point, nearest first.
+    """
+    n = len(coordinates)
+    k = min(k, n - 1)
+    neighbours = np.zeros((n, max(k, 0)), dtype=np.int32)
+    if k <= 0:
+        return neighbours
+    low = coordinates.min(axis=0)
+    extent = np.maximum(coordinates.max(axis=0) - low, 1e-9)
+    cell_size = max(math.sqrt(extent[0] * extent[1] * 2 / n), extent.max() / n)
+    shape = (np.floor(extent / cell_size).astype(np.int64) + 1)
+    cell_xy = np.minimum(((coordinates - low) // cell_size).astype(np.int64), shape - 1)
+    cell = cell_xy[:, 0] * shape[1] + cell_xy[:, 1]
+    # points sorted by cell, points of cells in a column of grid are contiguous.
+    by_cell = np.argsort(cell, kind='stable')
+    sorted_cell = cell[by_cell]
+    for c in np.unique(cell).tolist():
+        points = by_cell[np.searchsorted(sorted_cell, c):np.searchsorted(sorted_cell, c, side='right')]
+        cx, cy = divmod(c, int(shape[1]))
+        r = 1
+        while True:
+            columns = range(max(cx - r, 0), min(cx + r, shape[0] - 1) + 1)
+            y_low, y_high = max(cy - r, 0), min(cy + r, shape[1] - 1)
+            candidates = np.concatenate([
+                by_cell[np.searchsorted(sorted_cell, x * shape[1] + y_low):
+                        np.searchsorted(sorted_cell, x * shape[1] + y_high, side='right')] for x in columns])
+            if len(candidates) > k:
+                d = np.hypot(*(coordinates[points, None, :] - coordinates[None, candidates, :]).transpose(2, 0, 1))
+                d[candidates[None, :] == points[:, None]] = np.inf
+                nearest = np.argpartition(d, k - 1, axis=1)[:, :k]
+                nearest_d = np.take_along_axis(d, nearest, axis=1)
+                # every point within r cells of its own cell is a candidate.
+                whole_grid = len(candidates) == n
+                if whole_grid or nearest_d.max() <= r * cell_size:
+                    order = np.argsort(nearest_d, axis=1, kind='stable')
+                    neighbours[points] = candidates[np.take_along_axis(nearest, order, axis=1)]
+                    break
+            r += 1
+    return neighbours
+
+
+def improve_tour(tour, neighbours, distance, max_segment=3):
+    """
+    2-opt and Or-opt local search of a tour in place, moves are restricted to neighbour lists and use
+    don't-look bits: only cities at an end of a changed edge are searched again.
+    2-opt replaces edges (a, b) and (c, d) with (a, c) and (b, d) by reversing the shorter side of tour,
+    Or-opt moves a segment of up to max_segment cities (possibly reversed) between c and its successor or predecessor.
+
+    :param tour: list of cities.
+    :param neighbours: list of neighbours of every city, nearest first.
+    :param distance: function giving distance between two cities.
+    :param max_segment: longest segment moved by Or-opt, 0 disables Or-opt.
+    :return: change of tour length (negative).
+    """
+    n = len(tour)
+    if n < 5:
+        return 0.0
+    pos = [0] * n
+    for i, city in enumerate(tour):
+        pos[city] = i
+    queue = deque(tour)
+    queued = [True] * n
+    total = 0.0
+    eps = 1e-9
+
+    def reverse(i, j):
+        # reverse cities from position i forward to position j.
+        inner = (j - i) % n + 1
+        if 2 * inner > n:
+            i, j, inner = (j + 1) % n, (i - 1) % n, n - inner
+        for _ in range(inner // 2):
+            tour[i], tour[j] = tour[j], tour[i]
+            pos[tour[i]] = i
+            pos[tour[j]] = j
+            i = (i + 1) % n
+            j = (j - 1) % n
+
+    def move(i, length, x, reversed_segment):
+        # move segment of length cities starting at position i between x and its successor.
+        segment = [tour[(i + k) % n] for k in range(length)]
+        if reversed_segment:
+            segment.reverse()
+        forward = (pos[x] - (i + length - 1)) % n  # cities from end of segment to x.
+        backward = (i - pos[tour[(pos[x] + 1) % n]]) % n  # cities from successor of x to segment.
+        if forward <= backward:
+            k = i
+            for _ in range(forward):
+                city = tour[(k + length) % n]
+                tour[k] = city
+                pos[city] = k
+                k = (k + 1) % n
+            for city in segment:
+                tour[k] = city
+                pos[city] = k
+                k = (k + 1) % n
+        else:
+            k = (i + length - 1) % n
+            for _ in range(backward):
+                city = tour[(k - length) % n]
+                tour[k] = city
+                pos[city] = k
+                k = (k - 1) % n
+            for city in reversed(segment):
+                tour[k] = city
+                pos[city] = k
+                k = (k - 1) % n
+
+    def two_opt(a):
+        for step in (1, -1):
+            b = tour[(pos[a] + step) % n]
+            d_ab = distance(a, b)
+            for c in neighbours[a]:
+                d_ac = distance(a, c)
+                if d_ac >= d_ab:
+                    break
+                d = tour[(pos[c] + step) % n]
+                if c == b or d == a:
+                    continue
+                delta = d_ac + distance(b, d) - d_ab - distance(c, d)
+                if delta < -eps:
+                    if step == 1:
+                        reverse(pos[b], pos[c])
+                    else:
+                        reverse(pos[a], pos[d])
+                    return delta, (a, b, c, d)
+        return 0.0, None
+
+    def or_opt(a):
+        i = pos[a]
+        p = tour[i - 1]
+        for length in range(1, min(max_segment, n - 3) + 1):
+            e = tour[(i + length - 1) % n]
+            f = tour[(i + length) % n]
+            segment = {tour[(i + k) % n] for k in range(length)}
+            gain = distance(p, a) + distance(e, f) - distance(p, f)
+            if gain <= eps:
+                continue
+            for end, other in ((a, e), (e, a)):
+                for c in neighbours[end]:
+                    d_c = distance(c, end)
+                    if d_c >= gain:
+                        break
+                    if c in segment:
+                        continue
+                    for step in (1, -1):
+                        d = tour[(pos[c] + step) % n]
+                        if d in segment:
+                            continue
+                        delta = d_c + distance(other, d) - distance(c, d) - gain
+                        if delta < -eps:
+                            # segment goes between x and its successor y.
+                            x, y = (c, d) if step == 1 else (d, c)
+                            first = end if step == 1 else other
+                            move(i, length, x, first != a)
+                            return delta, (p, f, a, e, x, y)
+        return 0.0, None
+
+    while queue:
+        a = queue.popleft()
+        queued[a] = False
+        delta, touched = two_opt(a)
+        if touched is None and max_segment:
+            delta, touched = or_opt(a)
+        if touched is not None:
+            total += delta
+            for city in touched:
+                if not queued[city]:
+                    queued[city] = True
+                    queue.append(city)
+    return total
+
+
 class Path(Gene):
     # class properties
     cities = []
-    distance_matrix = []
+    coordinates = np.zeros((0, 2))
+    distance_matrix = np.zeros((0, 0), dtype=np.float32)
+    neighbours = None  # k nearest neighbours of every city, made by calculate_neighbours.
+    neighbour_lists = None  # neighbours as lists, for local_search.
+    edge_cache = None  # recently used distances in lazy mode, made by use_lazy_distances.
+    edge_cache_size = 0
 
     @classmethod
     def add_city(cls, new_city):
         # adding new city to cities
         cls.cities.append(new_city)
-        # adding new city column
-        for i in range(len(cls.cities) - 1):
-            cls.distance_matrix[i].append(City.get_distance(cls.cities[i], new_city))
-        # adding new city row
-        cls.distance_matrix.append([])
-        for i in range(len(cls.cities) - 1):
-            cls.distance_matrix[-1].append(cls.distance_matrix[i][-1])
-        cls.distance_matrix[-1].append(0)
+        cls.coordinates = np.vstack([cls.coordinates, [[new_city.x, new_city.y]]])
+        cls.neighbours = None
+        if cls.distance_matrix is None:
+            return
+        # adding new city row and column
+        n = len(cls.cities)
+        matrix = np.zeros((n, n), dtype=cls.distance_matrix.dtype)
+        matrix[:n - 1, :n - 1] = cls.distance_matrix
+        matrix[-1] = np.hypot(*(cls.coordinates - cls.coordinates[-1]).T)
+        matrix[:, -1] = matrix[-1]
+        cls.distance_matrix = matrix
 
     @classmethod
-    def calculate_distances(cls):
-        if len(cls.cities) > 0:
-            cls.distance_matrix = [[-1] * len(cls.cities) for _ in range(len(cls.cities))]
-            # calculate distance matrix
-            for i in range(len(cls.cities)):
-                for j in range(len(cls.cities)):
-                    if cls.distance_matrix[j][i] == -1:
-                        cls.distance_matrix[i][j] = City.get_distance(cls.cities[i], cls.cities[j])
-                    else:
-                        cls.distance_matrix[i][j] = cls.distance_matrix[j][i]
+    def calculate_distances(cls, dtype=np.float32, memmap_path=None, block_size=1024):
+        """
+        calculate distance matrix of cities with numpy, block_size rows at a time.
+
+        :param dtype: dtype of matrix, float32 halves memory of float64.
+        :param memmap_path: path of .npy file to keep matrix on disk (memory mapped) for very large instances.
+        :param block_size: number of rows calculated at once.
+        """
+        cls.coordinates = np.array([[i.x, i.y] for i in cls.cities], dtype=float).reshape(-1, 2)
+        cls.neighbours = None
+        n = len(cls.cities)
+        if memmap_path is None:
+            cls.distance_matrix = np.empty((n, n), dtype=dtype)
+        else:
+            cls.distance_matrix = np.lib.format.open_memmap(memmap_path, mode='w+', dtype=dtype, shape=(n, n))
+        for i in range(0, n, block_size):
+            block = cls.coordinates[i:i + block_size, None, :] - cls.coordinates[None, :, :]
+            cls.distance_matrix[i:i + block_size] = np.hypot(block[:, :, 0], block[:, :, 1])
+        if memmap_path is not None:
+            cls.distance_matrix.flush()
+
+    @classmethod
+    def use_lazy_distances(cls, cache_size=1 << 16):
+        """
+        drop distance matrix and calculate distances from coordinates when needed, for instances too large for
+        a matrix. tours are measured with numpy from coordinates, single edges (get_distance) go through a
+        bounded least recently used cache.
+
+        :param cache_size: number of edges kept in cache, 0 disables it.
+        """
+        cls.coordinates = np.array([[i.x, i.y] for i in cls.cities], dtype=float).reshape(-1, 2)
+        cls.distance_matrix = None
+        cls.edge_cache = OrderedDict()
+        cls.edge_cache_size = cache_size
+
+    @classmethod
+    def load_distances(cls, memmap_path):
+        """
+        use distance matrix saved by calculate_distances(memmap_path=...) without loading it in memory.
+
+        :param memmap_path: path of .npy file.
+        """
+        cls.distance_matrix = np.load(memmap_path, mmap_mode='r')
+
+    @classmethod
+    def calculate_neighbours(cls, k=10):
+        """
+        calculate k nearest neighbours of every city into neighbours, local search can restrict its moves to them.
+
+        :param k: number of neighbours.
+        """
+        cls.neighbours = nearest_neighbours(cls.coordinates, k)
+        cls.neighbour_lists = cls.neighbours.tolist()
 
     @classmethod
     def create_random(cls):
@@ -55,26 +290,121 @@ class Path(Gene):
     def mutate(self):
         OrderedGene.Mutate.single_swap(self.order)
 
+    def mutate_incremental(self, fitness):
+        n = len(self.order)
+        a, b = OrderedGene.Mutate.single_swap(self.order)
+        if n < 2:
+            return fitness
+        # only edges starting at a-1, a, b-1 and b change, edge k is (order[k], order[k+1]).
+        edges = {(a - 1) % n, a, (b - 1) % n, b}
+        order = self.order
+        after = sum(Path.get_distance(order[k], order[(k + 1) % n]) for k in edges)
+        order[a], order[b] = order[b], order[a]
+        before = sum(Path.get_distance(order[k], order[(k + 1) % n]) for k in edges)
+        order[a], order[b] = order[b], order[a]
+        return 1 / (1 / fitness + after - before)
+
+    def local_search(self, fitness):
+        if len(self.order) < 5:
+            return fitness
+        if Path.neighbours is None:
+            Path.calculate_neighbours()
+        distance = Path.distance_matrix.item if Path.distance_matrix is not None else Path.get_distance
+        tour = list(self.order)
+        delta = improve_tour(tour, Path.neighbour_lists, distance)
+        if delta == 0:
+            return fitness
+        self.order[:] = tour
+        return None if fitness is None else 1 / (1 / fitness + delta)
+
     @staticmethod
     def crossover(parent_a: 'Path', parent_b: 'Path'):
         child_a, child_b = OrderedGene.Crossover.single_point(parent_a.order, parent_b.order, Path.cities)
         return Path(child_a), Path(child_b)
 
+    def fitness_key(self):
+        return tuple(self.order)
+
+    def encode(self):
+        return np.asarray(self.order, dtype=np.int32).tobytes()
+
+    @classmethod
+    def decode(cls, data):
+        return Path(np.frombuffer(data, dtype=np.int32).tolist())
+
     def calculate_fitness(self):
         if len(self.order) >= 2:
-            d = 0
-            for j in range(len(self.order)):
-                d += Path.distance_matrix[self.order[j]][self.order[(j + 1) % len(self.order)]]
-            return 1 / d
+            return 1 / self.calculate_distance()
         else:
             return 1
 
-    def calculate_distance(self):
-        d = 0
-        for j in range(len(self.order)):
-            d += Path.distance_matrix[self.order[j]][self.order[(j + 1) % len(self.order)]]
+    @classmethod
+    def get_distance(cls, a, b):
+        if cls.distance_matrix is not None:
+            return float(cls.distance_matrix[a, b])
+        key = (int(a), int(b)) if a < b else (int(b), int(a))
+        d = cls.edge_cache.get(key)
+        if d is not None:
+            cls.edge_cache.move_to_end(key)
+            return d
+        d = math.hypot(*(cls.coordinates[a] - cls.coordinates[b]))
+        if cls.edge_cache_size > 0:
+            cls.edge_cache[key] = d
+            if len(cls.edge_cache) > cls.edge_cache_size:
+                cls.edge_cache.popitem(last=False)
         return d
 
+    @classmethod
+    def get_tour_distances(cls, orders, block_size=1 << 20):
+        """
+        length of every tour (row) of orders, from distance matrix or from coordinates in lazy mode.
+
+        :param orders: (tours x cities) array of tours.
+        :param block_size: maximum number of edges measured at once.
+        :return: array of lengths.
+        """
+        distances = np.empty(len(orders))
+        rows = max(1, block_size // max(orders.shape[1], 1))
+        for i in range(0, len(orders), rows):
+            block = orders[i:i + rows]
+            following = np.roll(block, -1, axis=1)
+            if cls.distance_matrix is not None:
+                distances[i:i + rows] = cls.distance_matrix[block, following].sum(axis=1, dtype=np.float64)
+            else:
+                edges = cls.coordinates[block] - cls.coordinates[following]
+                distances[i:i + rows] = np.hypot(edges[..., 0], edges[..., 1]).sum(axis=1)
+        return distances
+
+    @classmethod
+    def get_distance_array(cls):
+        return cls.distance_matrix
+
+    @classmethod
+    def calculate_fitness_batch(cls, genes):
+        if len(cls.cities) < 2:
+            return [1] * len(genes)
+        # (population x cities) matrix of tours, each edge is (city, next city)
+        orders = np.array([i.order for i in genes])
+        return (1 / cls.get_tour_distances(orders)).tolist()
+
+    def calculate_distance(self):
+        return float(Path.get_tour_distances(np.asarray(self.order).reshape(1, -1))[0])
+
+
+def get_tsp_pool(population_size, compact=False, local_search_top_k=0, local_search_fraction=0.0):
+    # compact keeps all tours in one numpy array, useful for large populations.
+    # local search improves best local_search_top_k tours and a random fraction of tours with 2-opt and Or-opt.
+    local_search = None
+    if local_search_top_k or local_search_fraction:
+        local_search = LocalSearch(top_k=local_search_top_k, fraction=local_search_fraction)
+    return GenePool(Path, population_size, mutation_rate=0.05, crossover_rate=1, select_func=Selection.get_tournament(tournament_size=5),
+                    population_backend=PermutationArray(Path) if compact else None, local_search=local_search)
+
 
-def get_tsp_pool(population_size):
-    return GenePool(Path, population_size, mutation_rate=0.05, crossover_rate=1, select_func=Selection.get_tournament(tournament_size=5))
+def get_random_tsp_pool(population_size=1000, city_count=100, seed=0, compact=False, local_search_top_k=0,
+                        local_search_fraction=0.0):
+    # random cities in a 1000 x 1000 square, for headless runs (python -m Genetic.Runner).
+    rng = random.Random(seed)
+    Path.cities = [City(rng.uniform(0, 1000), rng.uniform(0, 1000)) for _ in range(city_count)]
+    Path.calculate_distances()
+    return get_tsp_pool(population_size, compact, local_search_top_k, local_search_fraction)
@@ -1,6 +1,7 @@
+import numpy as np
 import pygame
 import TSP
-from Plotter.PygamePlotter import Plotter
+from Plotter.BackgroundRenderer import BackgroundRenderer, HistogramPlot, LinePlot
 
 # initialize the pygame
 pygame.init()
@@ -50,8 +51,14 @@ update_panel = (400, 10, 380, 380)
 rect4 = pygame.Rect(400, 400, 380, 380)
 generation_panel = (400, 400, 380, 380)
 
-pop_graph = Plotter(screen, (population_panel[0], population_panel[1]), (population_panel[2], population_panel[3]))
-gen_graph = Plotter(screen, (generation_panel[0], generation_panel[1]), (generation_panel[2], generation_panel[3]))
+# graphs are rendered in background from snapshots, so evolution does not wait for matplotlib.
+pop_graph = HistogramPlot((population_panel[0], population_panel[1]), (population_panel[2], population_panel[3]),
+                          'fitness_histogram', title="Frequency distribution", xlabel="fitness", ylabel="Frequency")
+gen_graph = LinePlot((generation_panel[0], generation_panel[1]), (generation_panel[2], generation_panel[3]),
+                     'generation_distance', title="Best distance (y) vs generation(x)", xlabel="Generation",
+                     ylabel="Best Distance")
+renderer = BackgroundRenderer([pop_graph, gen_graph], fps=10)
+renderer.start()
 # text
 font = pygame.font.Font('freesansbold.ttf', 16)
 
@@ -123,21 +130,12 @@ while running:
     draw_text("Best ever" + s, (update_panel[0], update_panel[1]))
 
     # display graph
-    pop_graph.clear()
-    pop_graph.ax.hist(tsp.get_fitness(), bins=20)
-    pop_graph.ax.set_title("Frequency distribution")
-    pop_graph.ax.set_xlabel("fitness")
-    pop_graph.ax.set_ylabel("Frequency")
-    pop_graph.show()
-
-    # display graph
-    gen_graph.clear()
-    gen_graph.ax.plot(list(range(1, len(generation_distance) + 1)), generation_distance)
-    gen_graph.ax.set_title("Best distance (y) vs generation(x)")
-    gen_graph.ax.set_xlabel("Generation")
-    gen_graph.ax.set_ylabel("Best Distance")
-    gen_graph.show()
+    if tsp.get_fitness():
+        renderer.submit({'fitness_histogram': np.histogram(tsp.get_fitness(), bins=20),
+                         'generation_distance': np.array(generation_distance)})
+    renderer.blit(screen)
 
     pygame.display.update()
 
+renderer.stop()
 pygame.quit()
@@ -0,0 +1,139 @@
+import io
+import os
+import pickle
+import random
+
+import numpy as np
+
+# format of genomes in a checkpoint.
+ARRAY = 'array'  # 2-D array of population backend (PermutationArray).
+ENCODED = 'encoded'  # bytes of Gene.encode (pickled genes unless gene overrides encode).
+
+
+def to_bytes_array(data: bytes) -> np.ndarray:
+    """
+    view bytes as uint8 array to store them in .npz.
+
+    :param data: bytes.
+    :return: array.
+    """
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def get_population_and_fitness(pool) -> (list, np.ndarray):
+    """
+    get population and its (not normalized) fitness of GenePool or NonDominatedGenePool.
+
+    :param pool: gene pool.
+    :return: list of genes and fitness array.
+    """
+    if hasattr(pool, 'wrappers'):
+        return [i.gene for i in pool.wrappers], np.array([i.fitness for i in pool.wrappers], dtype=float)
+    return pool.population, np.array(pool.raw_fitness, dtype=float)
+
+
+def save_checkpoint(pool, path: str, generation: int = 0) -> None:
+    """
+    save population, fitness (with ranks and crowding distances of NonDominatedGenePool) and state of random of pool
+    into an uncompressed .npz file.
+    genomes of a pool with population_backend are saved as its array, others as bytes of Gene.encode.
+    file is written next to path and renamed over it, so a checkpoint is never left half written.
+
+    :param pool: GenePool or NonDominatedGenePool.
+    :param path: path of checkpoint.
+    :param generation: generation number saved with checkpoint.
+    :return: None
+    """
+    population, fitness = get_population_and_fitness(pool)
+    arrays = {
+        'fitness': fitness,
+        'generation': np.array(generation),
+        'random_state': to_bytes_array(pickle.dumps(random.getstate())),
+    }
+    if hasattr(pool, 'wrappers'):
+        # ranks and crowding distances were assigned over parents and offspring, they can not be calculated again
+        # from survivors alone.
+        arrays['ranks'] = np.array([i.rank for i in pool.wrappers], dtype=np.int64)
+        arrays['distances'] = np.array([i.cDist for i in pool.wrappers], dtype=float)
+    backend = getattr(pool, 'population_backend', None)
+    if backend is not None and backend.get_array() is not None:
+        arrays['format'] = np.array(ARRAY)
+        arrays['genomes'] = backend.get_array()
+    else:
+        encoded = [i.encode() for i in population]
+        arrays['format'] = np.array(ENCODED)
+        arrays['genomes'] = to_bytes_array(b''.join(encoded))
+        arrays['offsets'] = np.cumsum([0] + [len(i) for i in encoded], dtype=np.int64)
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(buffer.getbuffer())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(pool, path: str) -> int:
+    """
+    restore population, fitness and state of random of pool from a checkpoint, fitness is not recalculated.
+    a resumed run continues exactly as the run that saved the checkpoint.
+
+    :param pool: GenePool or NonDominatedGenePool of same gene type as the saved one.
+    :param path: path of checkpoint.
+    :return: generation number saved with checkpoint.
+    """
+    with np.load(path) as checkpoint:
+        genomes = checkpoint['genomes']
+        if str(checkpoint['format']) == ARRAY:
+            population = pool.population_backend.unpack(genomes)
+        else:
+            data = genomes.tobytes()
+            offsets = checkpoint['offsets'].tolist()
+            population = [pool.gene_type.decode(data[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)]
+        fitness = checkpoint['fitness'].tolist()
+        random.setstate(pickle.loads(checkpoint['random_state'].tobytes()))
+        generation = int(checkpoint['generation'])
+        ranks = checkpoint['ranks'].tolist() if 'ranks' in checkpoint else None
+        distances = checkpoint['distances'].tolist() if 'distances' in checkpoint else None
+    pool.dirty = [False] * len(population)
+    if hasattr(pool, 'wrappers'):
+        # saved order is kept, selection draws wrappers by position.
+        if ranks is None:
+            wrappers = pool.evaluate(population, fitness)
+        else:
+            wrappers = pool.wrap(population, fitness)
+            for wrapper, rank, distance in zip(wrappers, ranks, distances):
+                wrapper.rank = rank
+                wrapper.cDist = distance
+        pool.population = population
+        pool.wrappers = wrappers
+    else:
+        pool.population = population
+        pool.fitness = pool.evaluate(population, fitness)
+    return generation
+
+
+class Checkpointer:
+    """ Saves a checkpoint of pool every interval generations, call it after every generation."""
+
+    def __init__(self, path: str, interval: int = 10):
+        """
+        Create a checkpointer.
+
+        :param path: path of checkpoint, overwritten every time.
+        :param interval: generations between checkpoints.
+        """
+        self.path = path
+        self.interval = interval
+
+    def __call__(self, pool, generation: int) -> None:
+        """
+        save checkpoint if generation is a multiple of interval.
+
+        :param pool: gene pool.
+        :param generation: number of generations done.
+        :return: None
+        """
+        if generation % self.interval == 0:
+            save_checkpoint(pool, self.path, generation)
@@ -0,0 +1,355 @@
+import os
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Hashable, List, Optional
+
+
+def calculate_fitness_chunk(genes: List) -> List:
+    """
+    calculate fitness of a chunk of genes one after another.
+
+    :param genes: list of genes.
+    :return: list of fitness in same order as genes.
+    """
+    return [i.calculate_fitness() for i in genes]
+
+
+def get_fitness_func(gene_type: type = None) -> Callable[[List], List]:
+    """
+    get function calculating fitness of a list of genes, preferring batch fitness of gene_type.
+
+    :param gene_type: type of genes.
+    :return: function taking list of genes and returning list of fitness.
+    """
+    batch = getattr(gene_type, 'calculate_fitness_batch', None)
+    if batch is not None:
+        return batch
+    return calculate_fitness_chunk
+
+
+def split_chunks(items: List, chunk_size: int) -> List[List]:
+    """
+    split items into consecutive chunks of chunk_size (last chunk may be smaller).
+
+    :param items: list of items.
+    :param chunk_size: size of each chunk.
+    :return: list of chunks.
+    """
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+class Evaluator(ABC):
+    """
+    Evaluator is template for the strategy used by gene pools to calculate fitness of a population.
+    """
+
+    @abstractmethod
+    def map(self, func: Callable[[List], List], genes: List) -> List:
+        """
+        apply func on the genes and return its results in same order as genes.
+
+        :param func: function taking list of genes and returning list of results.
+        :param genes: list of genes.
+        :return: list of results.
+        """
+        pass
+
+    def evaluate(self, genes: List, gene_type: type = None) -> List:
+        """
+        calculate fitness of genes.
+        if gene_type has calculate_fitness_batch it is used on each chunk in place of calculate_fitness.
+
+        :param genes: list of genes.
+        :param gene_type: type of genes.
+        :return: list of fitness in same order as genes.
+        """
+        return self.map(get_fitness_func(gene_type), genes)
+
+    def submit(self, func: Callable[[List], List], genes: List) -> Future:
+        """
+        start applying func on genes without waiting for it. by default func runs now in calling thread.
+
+        :param func: function taking list of genes and returning list of results.
+        :param genes: list of genes.
+        :return: future of list of results.
+        """
+        future = Future()
+        try:
+            future.set_result(self.map(func, genes))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def close(self) -> None:
+        """
+        release resources held by evaluator.
+
+        :return: None
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SerialEvaluator(Evaluator):
+    """ Evaluates all genes in the calling thread."""
+
+    def map(self, func: Callable[[List], List], genes: List) -> List:
+        if not genes:
+            return []
+        return list(func(genes))
+
+
+class ExecutorEvaluator(Evaluator):
+    """
+    Evaluates genes in chunks on a concurrent.futures executor. Executor is created on first use and reused
+    until close is called.
+    """
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: Optional[int] = None):
+        """
+        Create an executor based evaluator.
+
+        :param workers: number of workers. (None means number of cpus.)
+        :param chunk_size: number of genes sent to a worker at once. (None means split evenly, 4 chunks per worker.)
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.executor = None
+
+    @abstractmethod
+    def create_executor(self) -> Executor:
+        """
+        Create the executor.
+
+        :return: executor.
+        """
+        pass
+
+    def get_executor(self) -> Executor:
+        """
+        get executor, creating it if needed.
+
+        :return: executor.
+        """
+        if self.executor is None:
+            self.executor = self.create_executor()
+        return self.executor
+
+    def get_chunk_size(self, count: int) -> int:
+        """
+        get size of chunks for count genes.
+
+        :param count: number of genes.
+        :return: chunk size.
+        """
+        if self.chunk_size:
+            return self.chunk_size
+        return max(1, -(-count // (self.workers * 4)))
+
+    def map(self, func: Callable[[List], List], genes: List) -> List:
+        if not genes:
+            return []
+        chunks = split_chunks(genes, self.get_chunk_size(len(genes)))
+        if len(chunks) == 1:
+            return list(func(chunks[0]))
+        results = []
+        # executor.map yields results in order of chunks.
+        for i in self.get_executor().map(func, chunks):
+            results.extend(i)
+        return results
+
+    def submit(self, func: Callable[[List], List], genes: List) -> Future:
+        return self.get_executor().submit(func, genes)
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['executor'] = None
+        return state
+
+
+class ThreadPoolEvaluator(ExecutorEvaluator):
+    """
+    Evaluates genes on a pool of threads.
+    Useful when fitness releases the GIL (numpy, io, external programs).
+    """
+
+    def create_executor(self) -> Executor:
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+
+class ProcessPoolEvaluator(ExecutorEvaluator):
+    """
+    Evaluates genes on a pool of processes.
+    Genes are pickled to the workers, so class level data used by fitness (like Path.cities) must be set up
+    before the first evaluation (inherited on fork) or at import of the gene module.
+    """
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: Optional[int] = None, mp_context: Any = None):
+        """
+        Create a process pool evaluator.
+
+        :param workers: number of worker processes. (None means number of cpus.)
+        :param chunk_size: number of genes sent to a worker at once. (None means split evenly, 4 chunks per worker.)
+        :param mp_context: multiprocessing context for the workers.
+        """
+        super().__init__(workers, chunk_size)
+        self.mp_context = mp_context
+
+    def create_executor(self) -> Executor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=self.mp_context)
+
+
+class FitnessCache:
+    """
+    Bounded least recently used cache of fitness, keyed by a hashable key supplied by the gene
+    (fitness_key of gene by default). Genes with key None are never cached.
+    """
+
+    def __init__(self, max_size: Optional[int] = 100000, key: Callable[[Any], Hashable] = None):
+        """
+        Create a fitness cache.
+
+        :param max_size: maximum number of fitness kept, least recently used is evicted first. (None means unbounded.)
+        :param key: function returning key of a gene. (None means gene.fitness_key())
+        """
+        self.max_size = max_size
+        self.key = key or (lambda gene: gene.fitness_key())
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def evaluate(self, genes: List, calculate: Callable[[List], List]) -> List:
+        """
+        get fitness of genes from cache, calculating only missing ones (once per distinct key).
+
+        :param genes: list of genes.
+        :param calculate: function calculating fitness of a list of genes.
+        :return: list of fitness in same order as genes.
+        """
+        fitness = [None] * len(genes)
+        keys = [self.key(i) for i in genes]
+        missing = OrderedDict()  # key of missing fitness -> positions of genes.
+        uncached = []  # positions of genes without key.
+        for i, key in enumerate(keys):
+            if key is None:
+                uncached.append(i)
+            elif key in self.entries:
+                self.entries.move_to_end(key)
+                fitness[i] = self.entries[key]
+                self.hits += 1
+            else:
+                missing.setdefault(key, []).append(i)
+        # duplicates of a missing key are calculated once, they count as hits.
+        self.misses += len(uncached) + len(missing)
+        self.hits += sum(len(i) - 1 for i in missing.values())
+        to_calculate = [genes[i[0]] for i in missing.values()] + [genes[i] for i in uncached]
+        calculated = calculate(to_calculate) if to_calculate else []
+        for (key, positions), value in zip(missing.items(), calculated):
+            for i in positions:
+                fitness[i] = value
+            self.entries[key] = value
+        for i, value in zip(uncached, calculated[len(missing):]):
+            fitness[i] = value
+        if self.max_size is not None:
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return fitness
+
+    def lookup(self, gene: Any) -> Any:
+        """
+        get fitness of a gene from cache, counting a hit or a miss.
+
+        :param gene: gene.
+        :return: fitness, None if not in cache.
+        """
+        key = self.key(gene)
+        if key is not None and key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def store(self, gene: Any, fitness: Any) -> None:
+        """
+        put fitness of a gene calculated outside of evaluate into cache.
+
+        :param gene: gene.
+        :param fitness: its fitness.
+        :return: None
+        """
+        key = self.key(gene)
+        if key is None:
+            return
+        self.entries[key] = fitness
+        self.entries.move_to_end(key)
+        if self.max_size is not None and len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        """
+        get fraction of lookups found in cache.
+
+        :return: hit rate.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self) -> None:
+        """
+        remove all entries and reset hit and miss counts.
+
+        :return: None
+        """
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def calculate_fitness(genes: List, gene_type: type, evaluator: Evaluator, cache: FitnessCache = None) -> List:
+    """
+    calculate fitness of genes with evaluator, looking up cache first if given.
+
+    :param genes: list of genes.
+    :param gene_type: type of genes.
+    :param evaluator: evaluator.
+    :param cache: fitness cache.
+    :return: list of fitness in same order as genes.
+    """
+    if cache is None:
+        return evaluator.evaluate(genes, gene_type)
+    return cache.evaluate(genes, lambda to_calculate: evaluator.evaluate(to_calculate, gene_type))
+
+
+def calculate_missing_fitness(genes: List, known: List, gene_type: type, evaluator: Evaluator,
+                              cache: FitnessCache = None) -> List:
+    """
+    calculate fitness of genes whose fitness is not known yet.
+
+    :param genes: list of genes.
+    :param known: list of known fitness in same order as genes, None for genes to calculate.
+    :param gene_type: type of genes.
+    :param evaluator: evaluator.
+    :param cache: fitness cache.
+    :return: list of fitness in same order as genes.
+    """
+    missing = [i for i, j in enumerate(known) if j is None]
+    fitness = list(known)
+    calculated = calculate_fitness([genes[i] for i in missing], gene_type, evaluator, cache) if missing else []
+    for i, j in zip(missing, calculated):
+        fitness[i] = j
+    return fitness
@@ -0,0 +1,278 @@
+"""
+Per generation instrumentation of gene pools: wall time of every phase of generate, number of fitness
+evaluations, hit rate of fitness cache and allocated memory blocks.
+
+    profiler = Profiler(sinks=[JsonlSink('stats.jsonl')])
+    pool = GenePool(Path, 1000, profiler=profiler)
+    pool.initialize_population()
+    for i in range(100):
+        pool.generate()
+    print(profiler.summary())
+"""
+import csv
+import json
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+
+class GenerationStats:
+    """ Measurements of one generation."""
+
+    def __init__(self, generation: int):
+        """
+        Create stats of a generation.
+
+        :param generation: number of generation (starting from 1).
+        """
+        self.generation = generation
+        self.phases = OrderedDict()  # name of phase -> seconds.
+        self.total = 0.0
+        self.population_size = 0
+        self.evaluations = 0  # fitness actually calculated.
+        self.carried = 0  # genes whose fitness was carried over or updated incrementally.
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.allocated_blocks = 0  # change of sys.getallocatedblocks over generation.
+
+    def cache_hit_rate(self) -> Optional[float]:
+        """
+        get fraction of cache lookups found in cache during generation.
+
+        :return: hit rate, None if pool has no cache or nothing was looked up.
+        """
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else None
+
+    def as_dict(self) -> dict:
+        """
+        get stats as a flat dict, phases are prefixed with 'time_'.
+
+        :return: dict.
+        """
+        stats = OrderedDict(generation=self.generation, total=self.total)
+        for name, seconds in self.phases.items():
+            stats['time_' + name] = seconds
+        stats['population_size'] = self.population_size
+        stats['evaluations'] = self.evaluations
+        stats['carried'] = self.carried
+        stats['cache_hits'] = self.cache_hits
+        stats['cache_misses'] = self.cache_misses
+        stats['cache_hit_rate'] = self.cache_hit_rate()
+        stats['allocated_blocks'] = self.allocated_blocks
+        return stats
+
+    def __repr__(self):
+        return "GenerationStats({})".format(", ".join("{}={!r}".format(k, v) for k, v in self.as_dict().items()))
+
+
+class Phase:
+    """ Context manager adding wall time of its block to a phase of current generation."""
+
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats: GenerationStats, name: str):
+        self.stats = stats
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        phases = self.stats.phases
+        phases[self.name] = phases.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+
+class NullPhase:
+    """ Context manager doing nothing, used when instrumentation is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+class NullProfiler:
+    """ Profiler of a pool without instrumentation, every call does nothing."""
+
+    enabled = False
+
+    def start_generation(self, pool: Any) -> None:
+        pass
+
+    def phase(self, name: str) -> NullPhase:
+        return NULL_PHASE
+
+    def count_evaluations(self, count: int) -> None:
+        pass
+
+    def end_generation(self, pool: Any) -> None:
+        pass
+
+
+class Profiler(NullProfiler):
+    """
+    Records GenerationStats of every generation of a pool and writes them to sinks.
+    the pool calls start_generation, phase, count_evaluations and end_generation from generate.
+    """
+
+    enabled = True
+
+    def __init__(self, sinks: List = (), track_allocations: bool = True, keep_history: bool = True):
+        """
+        Create a profiler.
+
+        :param sinks: objects with write(dict) receiving stats of every generation (JsonlSink, CsvSink).
+        :param track_allocations: record change of allocated memory blocks over every generation.
+        :param keep_history: keep stats of every generation in history.
+        """
+        self.sinks = list(sinks)
+        self.track_allocations = track_allocations
+        self.keep_history = keep_history
+        self.history = []
+        self.generation = 0
+        self.current = None
+        self.start = 0.0
+        self.start_blocks = 0
+        self.start_hits = 0
+        self.start_misses = 0
+
+    def start_generation(self, pool: Any) -> None:
+        """
+        start measuring a generation.
+
+        :param pool: gene pool.
+        :return: None
+        """
+        self.generation += 1
+        self.current = GenerationStats(self.generation)
+        cache = getattr(pool, 'fitness_cache', None)
+        if cache is not None:
+            self.start_hits, self.start_misses = cache.hits, cache.misses
+        if self.track_allocations:
+            self.start_blocks = sys.getallocatedblocks()
+        self.start = time.perf_counter()
+
+    def phase(self, name: str):
+        """
+        get context manager timing a phase of current generation.
+
+        :param name: name of phase.
+        :return: context manager.
+        """
+        if self.current is None:
+            # outside of generate, e.g. evaluate from initialize_population.
+            return NULL_PHASE
+        return Phase(self.current, name)
+
+    def count_evaluations(self, count: int) -> None:
+        """
+        count fitness calculations requested by pool during current generation (before fitness cache).
+
+        :param count: number of genes whose fitness was not known.
+        :return: None
+        """
+        if self.current is not None:
+            self.current.evaluations += count
+
+    def end_generation(self, pool: Any) -> GenerationStats:
+        """
+        finish measuring current generation and write its stats to sinks.
+
+        :param pool: gene pool.
+        :return: stats of generation.
+        """
+        stats = self.current
+        stats.total = time.perf_counter() - self.start
+        if self.track_allocations:
+            stats.allocated_blocks = sys.getallocatedblocks() - self.start_blocks
+        stats.population_size = len(pool.population)
+        stats.carried = stats.population_size - sum(getattr(pool, 'dirty', []))
+        cache = getattr(pool, 'fitness_cache', None)
+        if cache is not None:
+            stats.cache_hits = cache.hits - self.start_hits
+            stats.cache_misses = cache.misses - self.start_misses
+            # genes found in cache were not calculated.
+            stats.evaluations = stats.cache_misses
+        self.current = None
+        if self.keep_history:
+            self.history.append(stats)
+        for sink in self.sinks:
+            sink.write(stats.as_dict())
+        return stats
+
+    def summary(self) -> dict:
+        """
+        get totals over history: seconds of every phase and of generations, evaluations and cache hit rate.
+
+        :return: dict.
+        """
+        summary = OrderedDict(generations=len(self.history), total=0.0)
+        phases = OrderedDict()
+        evaluations = hits = misses = 0
+        for stats in self.history:
+            summary['total'] += stats.total
+            for name, seconds in stats.phases.items():
+                phases[name] = phases.get(name, 0.0) + seconds
+            evaluations += stats.evaluations
+            hits += stats.cache_hits
+            misses += stats.cache_misses
+        for name, seconds in phases.items():
+            summary['time_' + name] = seconds
+        summary['evaluations'] = evaluations
+        summary['cache_hit_rate'] = hits / (hits + misses) if hits + misses else None
+        return summary
+
+    def close(self) -> None:
+        """
+        close sinks.
+
+        :return: None
+        """
+        for sink in self.sinks:
+            sink.close()
+
+
+class JsonlSink:
+    """ Writes stats of every generation as a line of JSON."""
+
+    def __init__(self, path: str):
+        self.file = open(path, 'w')
+
+    def write(self, stats: dict) -> None:
+        self.file.write(json.dumps(stats) + '\n')
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class CsvSink:
+    """
+    Writes stats of every generation as a row of CSV, columns are taken from first generation
+    (phases first seen later are left out).
+    """
+
+    def __init__(self, path: str):
+        self.file = open(path, 'w', newline='')
+        self.writer = None
+
+    def write(self, stats: dict) -> None:
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(stats), extrasaction='ignore')
+            self.writer.writeheader()
+        self.writer.writerow(stats)
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
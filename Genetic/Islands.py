@@ -0,0 +1,287 @@
+import multiprocessing
+import queue
+import random
+import time
+from typing import Any, Callable, List, Optional
+
+
+def get_destinations(source: int, island_count: int, topology: str, rng: random.Random) -> List[int]:
+    """
+    get islands receiving migrants of source island.
+
+    :param source: index of island sending migrants.
+    :param island_count: number of islands.
+    :param topology: 'ring' (to next island), 'full' (to every other island) or 'random' (to a random other island).
+    :param rng: random generator for random topology.
+    :return: list of index of islands.
+    """
+    if island_count < 2:
+        return []
+    if topology == 'ring':
+        return [(source + 1) % island_count]
+    if topology == 'full':
+        return [i for i in range(island_count) if i != source]
+    if topology == 'random':
+        destination = rng.randrange(island_count - 1)
+        return [destination if destination < source else destination + 1]
+    raise ValueError("unknown topology: {}".format(topology))
+
+
+class Island:
+    """ A gene pool evolving on its own, exchanging compact encoded genes with other islands."""
+
+    def __init__(self, index: int, pool_factory: Callable[[], Any], seed: Optional[int] = None,
+                 migration_size: int = 1):
+        """
+        Create an island.
+
+        :param index: index of island.
+        :param pool_factory: function creating the gene pool (GenePool or NonDominatedGenePool) of island.
+        :param seed: seed of random for the island (None starts from current state of random).
+        :param migration_size: number of genes sent per migration.
+        """
+        saved = random.getstate()
+        if seed is not None:
+            random.seed(seed)
+        self.index = index
+        self.migration_size = migration_size
+        self.pool = pool_factory()
+        self.pool.initialize_population()
+        self.generation = 0
+        # own state of random, swapped in while island evolves, so islands run one after another in a process
+        # evolve as they do in their own processes.
+        self.random_state = random.getstate()
+        if seed is not None:
+            random.setstate(saved)
+
+    def evolve(self, generations: int, immigrants: (List[bytes], List) = None) -> (List[bytes], List):
+        """
+        accept immigrants, evolve for generations and return emigrants.
+
+        :param generations: number of generations.
+        :param immigrants: encoded genes and their fitness.
+        :return: encoded genes and their fitness.
+        """
+        saved = random.getstate()
+        random.setstate(self.random_state)
+        try:
+            if immigrants and immigrants[0]:
+                data, fitness = immigrants
+                self.pool.immigrate([self.pool.gene_type.decode(i) for i in data], fitness)
+            for i in range(generations):
+                self.pool.generate()
+                self.generation += 1
+        finally:
+            self.random_state = random.getstate()
+            random.setstate(saved)
+        return self.emigrate(self.migration_size)
+
+    def emigrate(self, count: int) -> (List[bytes], List):
+        """
+        get best genes of island encoded.
+
+        :param count: number of genes.
+        :return: encoded genes and their fitness.
+        """
+        genes, fitness = self.pool.emigrate(count)
+        return [i.encode() for i in genes], fitness
+
+
+def run_island(index: int, pool_factory: Callable[[], Any], seed: Optional[int], migration_size: int,
+               inbox: multiprocessing.Queue, outbox: multiprocessing.Queue) -> None:
+    """
+    worker process of an island, evolves on ('evolve', generations, immigrants) messages until ('stop', count).
+
+    :param index: index of island.
+    :param pool_factory: function creating the gene pool of island.
+    :param seed: seed of random for the island.
+    :param migration_size: number of emigrants per migration.
+    :param inbox: queue of messages from coordinator.
+    :param outbox: queue of messages to coordinator.
+    :return: None
+    """
+    try:
+        island = Island(index, pool_factory, seed, migration_size)
+        while True:
+            message = inbox.get()
+            if message[0] == 'evolve':
+                outbox.put(('migrants', index, island.evolve(message[1], message[2])))
+            else:
+                outbox.put(('result', index, island.pool.gene_type, island.emigrate(message[1])))
+                return
+    except BaseException as e:
+        outbox.put(('error', index, repr(e)))
+        raise
+
+
+class IslandModel:
+    """
+    Island model: islands (gene pools) evolve in separate processes and every migration_interval generations
+    the best migration_size genes of every island migrate to islands given by topology, replacing their worst genes.
+    Migrants travel as bytes from Gene.encode.
+
+    pool_factory is called inside worker processes, so it must be picklable (a module level function or
+    functools.partial) and set up class level data of genes (like Path.cities) unless processes are forked.
+    """
+
+    def __init__(self, pool_factory: Callable[[], Any], island_count: int = 4, migration_interval: int = 10,
+                 migration_size: int = 2, topology: str = 'ring', seed: Optional[int] = None,
+                 processes: bool = True, mp_context: Any = None):
+        """
+        Create an island model.
+
+        :param pool_factory: function creating the gene pool of an island.
+        :param island_count: number of islands.
+        :param migration_interval: generations between migrations.
+        :param migration_size: number of genes sent by an island per migration.
+        :param topology: 'ring', 'full' or 'random'.
+        :param seed: seed of run, island i is seeded with seed + i.
+        :param processes: run islands in worker processes, False runs them one after another in this process.
+        :param mp_context: multiprocessing context for the workers.
+        """
+        # fail early on unknown topology.
+        get_destinations(0, 2, topology, random.Random())
+        self.pool_factory = pool_factory
+        self.island_count = island_count
+        self.migration_interval = migration_interval
+        self.migration_size = migration_size
+        self.topology = topology
+        self.seed = seed
+        self.processes = processes
+        self.mp_context = mp_context or multiprocessing.get_context()
+        self.rng = random.Random(seed)
+        self.migrations = 0
+
+    def get_island_seed(self, index: int) -> Optional[int]:
+        """
+        get seed of island.
+
+        :param index: index of island.
+        :return: seed.
+        """
+        return None if self.seed is None else self.seed + index
+
+    def route(self, emigrants: List[tuple]) -> List[tuple]:
+        """
+        route emigrants of every island to its destinations.
+
+        :param emigrants: encoded genes and fitness sent by every island.
+        :return: encoded genes and fitness received by every island.
+        """
+        immigrants = [([], []) for _ in range(self.island_count)]
+        for source, (data, fitness) in enumerate(emigrants):
+            for destination in get_destinations(source, self.island_count, self.topology, self.rng):
+                immigrants[destination][0].extend(data)
+                immigrants[destination][1].extend(fitness)
+        return immigrants
+
+    def run(self, generations: int, result_size: int = 1) -> List[tuple]:
+        """
+        evolve all islands for generations.
+
+        :param generations: number of generations of every island.
+        :param result_size: number of best genes returned per island.
+        :return: best genes and their fitness of every island.
+        """
+        epochs = [self.migration_interval] * (generations // self.migration_interval)
+        if generations % self.migration_interval:
+            epochs.append(generations % self.migration_interval)
+        if self.processes:
+            return self.run_processes(epochs, result_size)
+        return self.run_inline(epochs, result_size)
+
+    def run_inline(self, epochs: List[int], result_size: int) -> List[tuple]:
+        """
+        run islands one after another in this process.
+
+        :param epochs: generations between migrations.
+        :param result_size: number of best genes returned per island.
+        :return: best genes and their fitness of every island.
+        """
+        islands = []
+        for i in range(self.island_count):
+            islands.append(Island(i, self.pool_factory, self.get_island_seed(i), self.migration_size))
+        immigrants = [None] * self.island_count
+        for generations in epochs:
+            emigrants = [island.evolve(generations, immigrants[i]) for i, island in enumerate(islands)]
+            immigrants = self.route(emigrants)
+            self.migrations += 1
+        for i, island in enumerate(islands):
+            if immigrants[i] and immigrants[i][0]:
+                island.evolve(0, immigrants[i])
+        return [island.pool.emigrate(result_size) for island in islands]
+
+    def run_processes(self, epochs: List[int], result_size: int) -> List[tuple]:
+        """
+        run every island in its own worker process.
+
+        :param epochs: generations between migrations.
+        :param result_size: number of best genes returned per island.
+        :return: best genes and their fitness of every island.
+        """
+        outbox = self.mp_context.Queue()
+        inboxes = [self.mp_context.Queue() for _ in range(self.island_count)]
+        workers = [self.mp_context.Process(target=run_island,
+                                           args=(i, self.pool_factory, self.get_island_seed(i), self.migration_size,
+                                                 inboxes[i], outbox))
+                   for i in range(self.island_count)]
+        # workers are not daemons, so islands may use process evaluators (daemons can not have children).
+        for worker in workers:
+            worker.start()
+        try:
+            immigrants = [None] * self.island_count
+            for generations in epochs:
+                for i in range(self.island_count):
+                    inboxes[i].put(('evolve', generations, immigrants[i]))
+                emigrants = [None] * self.island_count
+                for message in self.receive(outbox, workers):
+                    emigrants[message[1]] = message[2]
+                immigrants = self.route(emigrants)
+                self.migrations += 1
+            for i in range(self.island_count):
+                if immigrants[i] and immigrants[i][0]:
+                    inboxes[i].put(('evolve', 0, immigrants[i]))
+                inboxes[i].put(('stop', result_size))
+            results = [None] * self.island_count
+            for message in self.receive(outbox, workers, 'result'):
+                gene_type, (data, fitness) = message[2], message[3]
+                results[message[1]] = ([gene_type.decode(i) for i in data], fitness)
+            return results
+        finally:
+            # workers left waiting for messages after a failure are terminated.
+            deadline = time.monotonic() + 5
+            for worker in workers:
+                worker.join(timeout=max(0.0, deadline - time.monotonic()))
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+
+    def receive(self, outbox: multiprocessing.Queue, workers: List[multiprocessing.Process], kind: str = 'migrants',
+                poll_interval: float = 1.0) -> List[tuple]:
+        """
+        receive one message of kind from every island.
+        raises RuntimeError if an island reports an error or its worker died without answering (e.g. killed).
+
+        :param outbox: queue of messages from islands.
+        :param workers: worker process of every island.
+        :param kind: kind of message.
+        :param poll_interval: seconds between checks of workers while waiting.
+        :return: list of messages.
+        """
+        messages = []
+        answered = set()
+        while len(messages) < self.island_count:
+            try:
+                message = outbox.get(timeout=poll_interval)
+            except queue.Empty:
+                dead = [i for i, worker in enumerate(workers) if i not in answered and not worker.is_alive()]
+                if dead and outbox.empty():
+                    raise RuntimeError("island {} died without answering (exit code {})".format(
+                        dead[0], workers[dead[0]].exitcode))
+                continue
+            if message[0] == 'error':
+                raise RuntimeError("island {} failed: {}".format(message[1], message[2]))
+            if message[0] == kind:
+                messages.append(message)
+                answered.add(message[1])
+        return messages
@@ -1,7 +1,14 @@
 import math
+import pickle
 import random
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Callable, Hashable, List
+
+import numpy as np
+
+from Genetic.Evaluators import Evaluator, FitnessCache, SerialEvaluator, calculate_missing_fitness
+from Genetic.Instrumentation import NullProfiler, Profiler
+from Genetic.Runner import RunResult, run
 
 
 class Gene(ABC):
@@ -49,13 +56,53 @@ class Gene(ABC):
         """
         pass
 
+    def fitness_key(self) -> Hashable:
+        """
+        key identifying genotype of gene for FitnessCache, genes with equal keys must have equal fitness.
+        Override it to enable caching (e.g. tuple of the genotype).
+
+        :return: hashable key, None means gene is not cached.
+        """
+        return None
+
+    @classmethod
+    def calculate_fitness_batch(cls, genes: List['Gene']) -> List[List[float]]:
+        """
+        calculate fitness of many genes at once.
+        Override it when fitness of a whole population can be calculated faster together (e.g. with numpy),
+        gene pools use it in place of calculate_fitness.
+
+        :param genes: list of genes.
+        :return: list of fitness in same order as genes.
+        """
+        return [i.calculate_fitness() for i in genes]
+
+    def encode(self) -> bytes:
+        """
+        encode gene into bytes, used to send genes between processes (e.g. migrants of islands).
+        Override it (with decode) for a compact encoding of genotype, default pickles the gene.
+
+        :return: encoded gene.
+        """
+        return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def decode(cls, data: bytes) -> 'Gene':
+        """
+        decode gene encoded by encode.
+
+        :param data: encoded gene.
+        :return: gene.
+        """
+        return pickle.loads(data)
+
 
 class GeneWrapper:
     """ Wrapper for gene in a population."""
 
-    def __init__(self, gene: Gene):
+    def __init__(self, gene: Gene, fitness: List[float] = None):
         self.gene = gene
-        self.fitness = gene.calculate_fitness()
+        self.fitness = gene.calculate_fitness() if fitness is None else fitness
         self.rank = 0
         self.cDist = 0
 
@@ -63,10 +110,10 @@ class GeneWrapper:
         return self.rank == other.rank and self.cDist == other.cDist
 
     def __lt__(self, other):
-        return self.rank > other.rank or (self.rank == other.rank and self.cDist < self.cDist)
+        return self.rank > other.rank or (self.rank == other.rank and self.cDist < other.cDist)
 
     def __gt__(self, other):
-        return self.rank < other.rank or (self.rank == other.rank and self.cDist > self.cDist)
+        return self.rank < other.rank or (self.rank == other.rank and self.cDist > other.cDist)
 
     @staticmethod
     def dominates(p: 'GeneWrapper', q: 'GeneWrapper') -> bool:
@@ -133,24 +180,252 @@ def fast_non_dominated_sort(genes: List[GeneWrapper]) -> List[List[GeneWrapper]]
     return fronts
 
 
+def get_fitness_matrix(genes: List[GeneWrapper]) -> np.ndarray:
+    """
+    Returns fitness of gene wrappers as a (number of genes x number of objectives) array.
+
+    :param genes: List of gene wrappers.
+    :return: fitness matrix.
+    """
+    if not genes:
+        return np.zeros((0, 0))
+    return np.array([i.fitness for i in genes], dtype=float)
+
+
+def ranks_to_fronts(genes: List[GeneWrapper], ranks: np.ndarray) -> List[List[GeneWrapper]]:
+    """
+    Set rank of gene wrappers and group them into fronts in increasing order of ranks.
+
+    :param genes: List of gene wrappers.
+    :param ranks: rank of each gene (starting from 1).
+    :return: list of fronts.
+    """
+    fronts = [[] for _ in range(int(ranks.max()) if len(ranks) else 0)]
+    for gene, rank in zip(genes, ranks.tolist()):
+        gene.rank = rank
+        fronts[rank - 1].append(gene)
+    return fronts
+
+
+def domination_matrix_ranks(fitness: np.ndarray, block_size: int = 256) -> np.ndarray:
+    """
+    Returns non dominated rank (starting from 1) of every solution using numpy domination matrix.
+    domination matrix is made block_size rows at a time, so memory is O(block_size * N * M) instead of O(N * N).
+
+    :param fitness: (N x M) fitness matrix (maximized).
+    :param block_size: rows of domination matrix made at once.
+    :return: array of ranks.
+    """
+    pop_len = len(fitness)
+
+    def dominated_counts(rows: np.ndarray, columns: np.ndarray) -> np.ndarray:
+        # number of solutions in rows dominating each solution in columns.
+        counts = np.zeros(len(columns), dtype=np.int64)
+        others = fitness[columns].T
+        for i in range(0, len(rows), block_size):
+            block = fitness[rows[i:i + block_size]].T
+            # one objective at a time keeps temporaries 2-D.
+            no_worse = block[0][:, None] >= others[0]
+            better = block[0][:, None] > others[0]
+            for k in range(1, len(block)):
+                no_worse &= block[k][:, None] >= others[k]
+                better |= block[k][:, None] > others[k]
+            counts += np.count_nonzero(no_worse & better, axis=0)
+        return counts
+
+    everyone = np.arange(pop_len)
+    N = dominated_counts(everyone, everyone)
+    ranks = np.zeros(pop_len, dtype=np.int64)
+    r = 1
+    front = np.flatnonzero(N == 0)
+    remaining = everyone
+    while len(front):
+        ranks[front] = r
+        remaining = remaining[ranks[remaining] == 0]
+        # only solutions not yet ranked need their count updated.
+        N[remaining] -= dominated_counts(front, remaining)
+        front = remaining[N[remaining] == 0]
+        r += 1
+    return ranks
+
+
+def efficient_non_dominated_ranks(fitness: np.ndarray) -> np.ndarray:
+    """
+    Returns non dominated rank (starting from 1) of every solution with efficient non dominated sort using
+    binary search (ENS-BS). Solutions are visited in decreasing lexicographic order, so a solution can only be
+    dominated by solutions visited before it, and binary search finds the first front not dominating it.
+    For two objectives checking a front is O(1), so sorting is O(N log N).
+
+    :param fitness: (N x M) fitness matrix (maximized).
+    :return: array of ranks.
+    """
+    pop_len, objectives = fitness.shape if fitness.ndim == 2 else (len(fitness), 0)
+    ranks = np.zeros(pop_len, dtype=np.int64)
+    if pop_len == 0:
+        return ranks
+    # lexsort uses last key as primary key.
+    order = np.lexsort(tuple(-fitness[:, i] for i in reversed(range(objectives))))
+    rows = fitness.tolist()
+    fronts = []  # index of solutions in each front, in order of visit.
+
+    if objectives == 2:
+        def is_dominated(p: List[float], front: List[int]) -> bool:
+            # members of a front visited later have higher second objective.
+            q = rows[front[-1]]
+            return q[1] > p[1] or (q[1] == p[1] and q[0] > p[0])
+    else:
+        def is_dominated(p: List[float], front: List[int]) -> bool:
+            members = fitness[front]
+            return bool(((members >= p).all(axis=1) & (members > p).any(axis=1)).any())
+
+    for i in order.tolist():
+        low, high = 0, len(fronts)
+        while low < high:
+            mid = (low + high) // 2
+            if is_dominated(rows[i], fronts[mid]):
+                low = mid + 1
+            else:
+                high = mid
+        if low == len(fronts):
+            fronts.append([])
+        fronts[low].append(i)
+        ranks[i] = low + 1
+    return ranks
+
+
+def vectorized_non_dominated_sort(genes: List[GeneWrapper]) -> List[List[GeneWrapper]]:
+    """
+    Same as fast_non_dominated_sort, with domination checked on numpy fitness matrix.
+    Suited to moderate size of population.
+
+    :param genes: List of gene wrappers.
+    :return: list of fronts.
+    """
+    return ranks_to_fronts(genes, domination_matrix_ranks(get_fitness_matrix(genes)))
+
+
+def efficient_non_dominated_sort(genes: List[GeneWrapper]) -> List[List[GeneWrapper]]:
+    """
+    Same as fast_non_dominated_sort, with efficient non dominated sort using binary search (ENS-BS).
+    Suited to large population and few objectives.
+
+    :param genes: List of gene wrappers.
+    :return: list of fronts.
+    """
+    return ranks_to_fronts(genes, efficient_non_dominated_ranks(get_fitness_matrix(genes)))
+
+
+def crowding_distances(fitness: np.ndarray, ranks: np.ndarray = None) -> np.ndarray:
+    """
+    Returns crowding distance of every solution within its front in one pass over objectives.
+    for every objective solutions are argsorted by (rank, fitness), so every front is a contiguous run, and a
+    solution gets difference of its neighbours in the run divided by range of objective in its front.
+    first and last solution of a front in any objective get infinite distance. O(M N log N).
+
+    :param fitness: (N x M) fitness matrix.
+    :param ranks: rank of every solution, None means all solutions are in one front.
+    :return: array of crowding distances.
+    """
+    pop_len = len(fitness)
+    distances = np.zeros(pop_len)
+    if pop_len == 0:
+        return distances
+    if ranks is None:
+        ranks = np.zeros(pop_len, dtype=np.int64)
+    positions = np.arange(pop_len)
+    for k in range(fitness.shape[1]):
+        order = np.lexsort((fitness[:, k], ranks))
+        values = fitness[order, k]
+        sorted_ranks = ranks[order]
+        # start and end (inclusive) of front of every position in sorted order.
+        is_first = np.empty(pop_len, dtype=bool)
+        is_first[0] = True
+        np.not_equal(sorted_ranks[1:], sorted_ranks[:-1], out=is_first[1:])
+        is_last = np.empty(pop_len, dtype=bool)
+        is_last[-1] = True
+        is_last[:-1] = is_first[1:]
+        start = np.maximum.accumulate(np.where(is_first, positions, 0))
+        end = np.minimum.accumulate(np.where(is_last, positions, pop_len - 1)[::-1])[::-1]
+        span = values[end] - values[start]
+        interior = ~(is_first | is_last)
+        middle = positions[interior]
+        span = span[middle]
+        gap = values[middle + 1] - values[middle - 1]
+        # objective with same value in whole front adds nothing.
+        contribution = np.divide(gap, span, out=np.zeros(len(middle)), where=span > 0)
+        distances[order[middle]] += contribution
+        distances[order[~interior]] = math.inf
+    return distances
+
+
+def get_ranks(genes: List[GeneWrapper]) -> np.ndarray:
+    """
+    Returns rank of gene wrappers as an array.
+
+    :param genes: List of gene wrappers.
+    :return: array of ranks.
+    """
+    return np.fromiter((i.rank for i in genes), dtype=np.int64, count=len(genes))
+
+
+def assign_crowding_distances(genes: List[GeneWrapper], ranks: np.ndarray = None) -> np.ndarray:
+    """
+    set crowding distance (cDist) of all gene wrappers within their fronts.
+
+    :param genes: List of gene wrappers.
+    :param ranks: rank of every gene wrapper, None takes rank of wrappers (which must be set).
+    :return: array of crowding distances in same order as genes.
+    """
+    if ranks is None:
+        ranks = get_ranks(genes)
+    distances = crowding_distances(get_fitness_matrix(genes), ranks)
+    for gene, distance in zip(genes, distances.tolist()):
+        gene.cDist = distance
+    return distances
+
+
 def crowding_distance_assignment(front: List[GeneWrapper]) -> None:
     """
-    crowding distance for the front.
+    crowding distance for the front, normalized by range of every objective in front.
 
     :param front: front.
     :return: None.
     """
-    for i in range(len(front[0].fitness)):
-        front.sort(key=lambda x: x.fitness[i])
-        front[0].cDist = math.inf
-        front[-1].cDist = math.inf
-        for j in range(1, len(front) - 1):
-            front[j].cDist += abs(front[j + 1].fitness[i] - front[j - 1].fitness[i])
+    distances = crowding_distances(get_fitness_matrix(front))
+    for gene, distance in zip(front, distances.tolist()):
+        gene.cDist = distance
+
+
+def environmental_selection(ranks: np.ndarray, distances: np.ndarray, size: int) -> np.ndarray:
+    """
+    Returns index of survivors: whole fronts in increasing order of ranks while they fit in size, then solutions of
+    the front overflowing size with largest crowding distance. only the overflowing front is partially sorted.
+
+    :param ranks: rank of every solution (starting from 1).
+    :param distances: crowding distance of every solution.
+    :param size: number of survivors.
+    :return: array of index of survivors.
+    """
+    if size >= len(ranks):
+        return np.arange(len(ranks))
+    if size <= 0:
+        return np.zeros(0, dtype=np.int64)
+    # cumulative[r] is number of solutions with rank at most r.
+    cumulative = np.cumsum(np.bincount(ranks))
+    last = int(np.searchsorted(cumulative, size))
+    chosen = np.flatnonzero(ranks < last)
+    front = np.flatnonzero(ranks == last)
+    needed = size - len(chosen)
+    if needed < len(front):
+        front = front[np.argpartition(-distances[front], needed - 1)[:needed]]
+    return np.concatenate([chosen, front])
 
 
 class NonDominatedGenePool:
     def __init__(self, gene_type, population_size: int, tournament_fraction: float = 0.1,
-                 mutation_rate: float = 0.1, crossover_rate: float = 1):
+                 mutation_rate: float = 0.1, crossover_rate: float = 1, evaluator: Evaluator = None,
+                 sort_func: Callable[[List[GeneWrapper]], List[List[GeneWrapper]]] = fast_non_dominated_sort,
+                 fitness_cache: FitnessCache = None, profiler: Profiler = None):
         """
         Create a gene pool.
 
@@ -159,15 +434,25 @@ class NonDominatedGenePool:
         :param tournament_fraction: faction of population as size of tournament.
         :param mutation_rate: rate of mutation.
         :param crossover_rate: rate of crossover.
+        :param evaluator: evaluator used to calculate fitness (default is serial).
+        :param sort_func: non dominated sort (fast_non_dominated_sort, vectorized_non_dominated_sort or
+                          efficient_non_dominated_sort).
+        :param fitness_cache: cache of fitness by fitness_key of genes, None calculates fitness every time.
+        :param profiler: profiler recording time of every phase of generate, None disables instrumentation.
         """
         self.tournament_fraction = tournament_fraction
         self.population_size = population_size
         self.population = []
         self.fronts = []
         self.wrappers = []
+        self.dirty = []
         self.gene_type = gene_type
         self.mutation_rate = mutation_rate
         self.crossover_rate = crossover_rate
+        self.evaluator = evaluator or SerialEvaluator()
+        self.sort_func = sort_func
+        self.fitness_cache = fitness_cache
+        self.profiler = profiler or NullProfiler()
 
     def initialize_population(self) -> None:
         """
@@ -179,7 +464,8 @@ class NonDominatedGenePool:
         for i in range(self.population_size):
             self.population.append(self.gene_type.create_random())
         # evaluate
-        self.wrappers = NonDominatedGenePool.evaluate(self.population)
+        self.dirty = [True] * len(self.population)
+        self.wrappers = self.evaluate(self.population)
 
     def generate(self) -> None:
         """
@@ -191,24 +477,43 @@ class NonDominatedGenePool:
 
         :return: None
         """
+        profiler = self.profiler
+        profiler.start_generation(self)
         # selection
-        selected = self.select(self.wrappers, self.population_size)
+        with profiler.phase('selection'):
+            selected = self.select(self.wrappers, self.population_size)
 
         # crossover
-        new_population = self.crossover(selected)
+        with profiler.phase('crossover'):
+            new_population = self.crossover(selected)
 
         # mutation
-        self.mutate(new_population)
-        new_population = self.population + new_population
+        with profiler.phase('mutation'):
+            mutated = self.mutate(new_population)
 
         # evaluate
-        wrappers = NonDominatedGenePool.evaluate(new_population)
-        wrappers.sort(reverse=True)
-
-        self.population = []
-        for i in wrappers[:self.population_size]:
-            self.population.append(i.gene)
-        self.wrappers = wrappers[:self.population_size]
+        # parents keep their wrappers and genes passed through crossover unchanged carry their fitness, unless
+        # they were mutated (a selected parent is the same gene as in current population).
+        fitness_of = {id(i.gene): i.fitness for i in self.wrappers}
+        mutated_ids = {id(new_population[i]) for i in mutated}
+        carried = [None if id(i) in mutated_ids else fitness_of.get(id(i)) for i in new_population]
+        children = self.wrap(new_population, carried)
+        if mutated_ids:
+            fitness_of = {id(i.gene): i.fitness for i in children}
+            for i in self.wrappers:
+                if id(i.gene) in mutated_ids:
+                    i.fitness = fitness_of[id(i.gene)]
+        dirty = [id(i.gene) in mutated_ids for i in self.wrappers] + [i is None for i in carried]
+        wrappers = self.wrappers + children
+        ranks, distances = self.rank(wrappers)
+
+        # survival
+        with profiler.phase('survival'):
+            survivors = environmental_selection(ranks, distances, self.population_size).tolist()
+            self.wrappers = [wrappers[i] for i in survivors]
+            self.dirty = [dirty[i] for i in survivors]
+            self.population = [i.gene for i in self.wrappers]
+        profiler.end_generation(self)
 
     def select(self, wrappers: List[GeneWrapper], selection_size: int) -> List[Gene]:
         """
@@ -247,33 +552,97 @@ class NonDominatedGenePool:
                 new_population.append(selected_population[i])
         return new_population
 
-    def mutate(self, crossed_population: List[Gene]) -> None:
+    def mutate(self, crossed_population: List[Gene]) -> List[int]:
         """
         Mutate the population.
 
         :param crossed_population: list of genes to mutate.
-        :return:
+        :return: positions of mutated genes.
         """
-        for i in crossed_population:
+        mutated = []
+        for i, gene in enumerate(crossed_population):
             if random.random() <= self.mutation_rate:
-                i.mutate()
+                gene.mutate()
+                mutated.append(i)
+        return mutated
 
-    @staticmethod
-    def evaluate(population: List[Gene]) -> List[GeneWrapper]:
+    def evaluate(self, population: List[Gene], known_fitness: List[List[float]] = None) -> List[GeneWrapper]:
         """
-        Evaluate the rank and crowding distance of population.
+        Evaluate the rank and crowding distance of population, fitness is calculated only for genes without
+        known fitness.
 
         :param population: population to evaluate.
+        :param known_fitness: fitness already known in same order of population, None for unknown.
         :return: list of rank and crowding distance.
         """
-        wrappers = []
-        for i in population:
-            wrappers.append(GeneWrapper(i))
-        fronts = fast_non_dominated_sort(wrappers)
-        for i in fronts:
-            crowding_distance_assignment(i)
+        wrappers = self.wrap(population, known_fitness)
+        self.rank(wrappers)
         return wrappers
 
+    def wrap(self, population: List[Gene], known_fitness: List[List[float]] = None) -> List[GeneWrapper]:
+        """
+        wrap genes of population with their fitness, fitness is calculated only for genes without known fitness.
+
+        :param population: list of genes.
+        :param known_fitness: fitness already known in same order of population, None for unknown.
+        :return: list of gene wrappers.
+        """
+        if known_fitness is None:
+            known_fitness = [None] * len(population)
+        self.profiler.count_evaluations(sum(i is None for i in known_fitness))
+        with self.profiler.phase('evaluation'):
+            population_fitness = calculate_missing_fitness(population, known_fitness, self.gene_type, self.evaluator,
+                                                           self.fitness_cache)
+            return [GeneWrapper(gene, fitness) for gene, fitness in zip(population, population_fitness)]
+
+    def rank(self, wrappers: List[GeneWrapper]) -> (np.ndarray, np.ndarray):
+        """
+        set rank and crowding distance of gene wrappers.
+
+        :param wrappers: list of gene wrappers.
+        :return: arrays of ranks and crowding distances in same order as wrappers.
+        """
+        with self.profiler.phase('sorting'):
+            self.sort_func(wrappers)
+            ranks = get_ranks(wrappers)
+            return ranks, assign_crowding_distances(wrappers, ranks)
+
+    def run(self, **kwargs) -> RunResult:
+        """
+        run headless until a stopping criterion is met, see Genetic.Runner.run for arguments
+        (generations, time_limit, stagnation, target, callbacks, ...).
+
+        :return: result of run.
+        """
+        return run(self, **kwargs)
+
+    def emigrate(self, count: int) -> (List[Gene], List[List[float]]):
+        """
+        get best genes of population (by rank and crowding distance) to send to other pools.
+
+        :param count: number of genes.
+        :return: best genes and their fitness.
+        """
+        best = sorted(self.wrappers, reverse=True)[:count]
+        return [i.gene for i in best], [i.fitness for i in best]
+
+    def immigrate(self, genes: List[Gene], fitness: List[List[float]] = None) -> None:
+        """
+        replace worst genes of population (by rank and crowding distance) with genes from other pools.
+
+        :param genes: list of genes.
+        :param fitness: their fitness, None to calculate it.
+        :return: None
+        """
+        kept = sorted(self.wrappers, reverse=True)[:max(len(self.wrappers) - len(genes), 0)]
+        population = [i.gene for i in kept] + list(genes)
+        known = [i.fitness for i in kept] + (list(fitness) if fitness is not None else [None] * len(genes))
+        self.dirty = [i is None for i in known]
+        wrappers = self.evaluate(population, known)
+        wrappers.sort(reverse=True)
+        self.population = [i.gene for i in wrappers]
+        self.wrappers = wrappers
+
     def get_population(self) -> List[Gene]:
         """
         get population of current generation.
@@ -0,0 +1,79 @@
+from typing import List
+
+import numpy as np
+
+
+def get_permutation_dtype(length: int) -> np.dtype:
+    """
+    get smallest integer dtype that can hold items of a permutation of length.
+
+    :param length: length of permutation.
+    :return: numpy dtype.
+    """
+    if length <= np.iinfo(np.int16).max + 1:
+        return np.dtype(np.int16)
+    return np.dtype(np.int32)
+
+
+class PermutationArray:
+    """
+    Compact population backend for permutation (ordered) genes.
+    All permutations of a population are kept in one contiguous 2-D numpy array (one row per gene) and
+    every gene only holds a view of its row, so crossover and mutation of OrderedGene work on the rows in place.
+    """
+
+    def __init__(self, gene_type, attribute: str = 'order', dtype=None):
+        """
+        Create a permutation array backend.
+
+        :param gene_type: type of gene, gene_type(row) must create a gene holding row as its attribute.
+        :param attribute: name of attribute of gene holding the permutation.
+        :param dtype: integer dtype of array. (None means int16 when possible else int32.)
+        """
+        self.gene_type = gene_type
+        self.attribute = attribute
+        self.dtype = dtype
+        self.array = None
+
+    def pack(self, genes: List) -> List:
+        """
+        copy permutations of genes into a new array and return genes viewing its rows.
+        A new array is made every time, so genes of previous population remain valid.
+
+        :param genes: list of genes.
+        :return: list of genes in same order, backed by array.
+        """
+        if not genes:
+            self.array = None
+            return []
+        length = len(getattr(genes[0], self.attribute))
+        array = np.empty((len(genes), length), dtype=self.dtype or get_permutation_dtype(length))
+        for i, gene in enumerate(genes):
+            array[i] = getattr(gene, self.attribute)
+        return self.unpack(array)
+
+    def unpack(self, array: np.ndarray) -> List:
+        """
+        make genes viewing rows of array, array becomes the storage of population.
+
+        :param array: 2-D array of permutations.
+        :return: list of genes.
+        """
+        self.array = array
+        return [self.gene_type(row) for row in array]
+
+    def get_array(self) -> np.ndarray:
+        """
+        get array of current population.
+
+        :return: 2-D array with one permutation per row.
+        """
+        return self.array
+
+    def nbytes(self) -> int:
+        """
+        get memory used by permutations of current population.
+
+        :return: bytes.
+        """
+        return 0 if self.array is None else self.array.nbytes
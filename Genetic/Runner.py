@@ -0,0 +1,178 @@
+"""
+Headless driver running a gene pool until a stopping criterion is met.
+
+command line:
+    python -m Genetic.Runner Example_TSP.TSP:get_random_tsp_pool -a city_count=500 --generations 1000 --stagnation 100
+"""
+import argparse
+import ast
+import importlib
+import random
+import time
+from typing import Any, Callable, List, Optional
+
+
+def get_score(pool) -> float:
+    """
+    default score of a pool, higher is better.
+    GenePool: best (not normalized) fitness.
+    NonDominatedGenePool: sum over objectives of best fitness in first front.
+
+    :param pool: gene pool.
+    :return: score.
+    """
+    if hasattr(pool, 'wrappers'):
+        front = [i.fitness for i in pool.wrappers if i.rank == 1] or [i.fitness for i in pool.wrappers]
+        return sum(max(i) for i in zip(*front))
+    return max(pool.raw_fitness)
+
+
+class RunResult:
+    """ Outcome of a run."""
+
+    def __init__(self, generations: int, elapsed: float, best_score: float, stop_reason: str, history: List[float]):
+        """
+        Create a run result.
+
+        :param generations: number of generations done (including those before a resume).
+        :param elapsed: wall time in seconds.
+        :param best_score: best score seen.
+        :param stop_reason: 'generations', 'time_limit', 'stagnation', 'target' or 'callback'.
+        :param history: score after every generation.
+        """
+        self.generations = generations
+        self.elapsed = elapsed
+        self.best_score = best_score
+        self.stop_reason = stop_reason
+        self.history = history
+
+    def __repr__(self):
+        return "RunResult(generations={}, elapsed={:.3f}, best_score={}, stop_reason={!r})".format(
+            self.generations, self.elapsed, self.best_score, self.stop_reason)
+
+
+def run(pool, generations: Optional[int] = None, time_limit: Optional[float] = None,
+        stagnation: Optional[int] = None, target: Optional[float] = None,
+        callbacks: List[Callable[[Any, int], Optional[bool]]] = (), score: Callable[[Any], float] = get_score,
+        tolerance: float = 0, initialize: bool = True, start_generation: int = 0) -> RunResult:
+    """
+    run pool without any rendering until one of the stopping criteria is met.
+    at least one criterion should be given, else it runs until a callback returns True.
+
+    :param pool: GenePool or NonDominatedGenePool.
+    :param generations: maximum number of generations.
+    :param time_limit: maximum wall time in seconds.
+    :param stagnation: stop after this many generations without improvement of score by more than tolerance.
+    :param target: stop once score reaches target.
+    :param callbacks: functions called with (pool, generation) after every generation, returning True stops run.
+    :param score: function giving score of pool (higher is better).
+    :param tolerance: minimum improvement of score counted by stagnation.
+    :param initialize: initialize population of pool before running.
+    :param start_generation: number of generations already done (e.g. restored from a checkpoint), generations is
+     the total budget and callbacks are called with total generation numbers.
+    :return: result of run.
+    """
+    start = time.perf_counter()
+    if initialize:
+        pool.initialize_population()
+    best_score = score(pool)
+    history = []
+    generation = start_generation
+    last_improvement = start_generation
+    stop_reason = None
+    while stop_reason is None:
+        if generations is not None and generation >= generations:
+            stop_reason = 'generations'
+            break
+        if time_limit is not None and time.perf_counter() - start >= time_limit:
+            stop_reason = 'time_limit'
+            break
+        pool.generate()
+        generation += 1
+        current = score(pool)
+        history.append(current)
+        if current > best_score + tolerance:
+            last_improvement = generation
+        best_score = max(best_score, current)
+        for callback in callbacks:
+            if callback(pool, generation):
+                stop_reason = 'callback'
+        if target is not None and best_score >= target:
+            stop_reason = 'target'
+        elif stagnation is not None and generation - last_improvement >= stagnation:
+            stop_reason = 'stagnation'
+    return RunResult(generation, time.perf_counter() - start, best_score, stop_reason, history)
+
+
+def load_factory(spec: str) -> Callable:
+    """
+    load a pool factory from 'module:function'.
+
+    :param spec: module and function.
+    :return: function.
+    """
+    module, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+def parse_arguments(pairs: List[str]) -> dict:
+    """
+    parse key=value pairs, values are python literals (strings may be left unquoted).
+
+    :param pairs: list of key=value.
+    :return: keyword arguments.
+    """
+    kwargs = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        try:
+            kwargs[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            kwargs[key] = value
+    return kwargs
+
+
+def main(argv: List[str] = None) -> RunResult:
+    parser = argparse.ArgumentParser(description="run a gene pool headless.")
+    parser.add_argument('factory', help="module:function returning a gene pool")
+    parser.add_argument('-a', '--arg', action='append', default=[], help="key=value argument of factory")
+    parser.add_argument('--generations', type=int)
+    parser.add_argument('--time-limit', type=float, help="seconds")
+    parser.add_argument('--stagnation', type=int, help="generations without improvement")
+    parser.add_argument('--target', type=float, help="target score")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--log-interval', type=int, default=10, help="generations between progress lines, 0 is quiet")
+    parser.add_argument('--checkpoint', help="path of checkpoint")
+    parser.add_argument('--checkpoint-interval', type=int, default=10)
+    parser.add_argument('--resume', action='store_true', help="restore checkpoint before running")
+    args = parser.parse_args(argv)
+    if args.generations is None and args.time_limit is None and args.stagnation is None and args.target is None:
+        parser.error("give at least one of --generations, --time-limit, --stagnation or --target")
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    pool = load_factory(args.factory)(**parse_arguments(args.arg))
+    callbacks = []
+    start = time.perf_counter()
+    if args.log_interval:
+        def log(pool, generation):
+            if generation % args.log_interval == 0:
+                print("generation {:>8}  score {:<22}  {:.2f}s".format(generation, get_score(pool),
+                                                                    time.perf_counter() - start))
+        callbacks.append(log)
+    initialize = True
+    start_generation = 0
+    if args.checkpoint:
+        from Genetic.Checkpoint import Checkpointer, load_checkpoint
+        if args.resume:
+            start_generation = load_checkpoint(pool, args.checkpoint)
+            initialize = False
+        callbacks.append(Checkpointer(args.checkpoint, args.checkpoint_interval))
+    result = run(pool, args.generations, args.time_limit, args.stagnation, args.target, callbacks,
+                 initialize=initialize, start_generation=start_generation)
+    print(result)
+    return result
+
+
+if __name__ == '__main__':
+    main()
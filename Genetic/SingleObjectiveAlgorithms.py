@@ -1,6 +1,17 @@
+import heapq
+import pickle
 import random
+from bisect import bisect_right
+from itertools import accumulate
 from abc import ABC, abstractmethod
-from typing import Callable, List, Type
+from typing import Callable, Hashable, List, Optional, Type
+
+import numpy as np
+
+from Genetic.Evaluators import Evaluator, FitnessCache, SerialEvaluator, calculate_missing_fitness
+from Genetic.Instrumentation import NullProfiler, Profiler
+from Genetic.Populations import PermutationArray
+from Genetic.Runner import RunResult, run
 
 
 class Gene(ABC):
@@ -48,6 +59,67 @@ class Gene(ABC):
         """
         pass
 
+    def mutate_incremental(self, fitness: float) -> Optional[float]:
+        """
+        Mutate the gene and return its new fitness updated from fitness before mutation (delta evaluation).
+        Override it when change of fitness by a mutation is cheaper than calculate_fitness.
+
+        :param fitness: fitness of gene before mutation.
+        :return: fitness after mutation, None if it is not known.
+        """
+        self.mutate()
+        return None
+
+    def local_search(self, fitness: Optional[float]) -> Optional[float]:
+        """
+        Improve the gene in place with a local search and return its new fitness (memetic stage of GenePool).
+        Override it with a problem specific improvement (e.g. 2-opt of a tour), default leaves gene as it is.
+
+        :param fitness: fitness of gene before local search, None if it is not known.
+        :return: fitness after local search, None if it is not known.
+        """
+        return fitness
+
+    def fitness_key(self) -> Hashable:
+        """
+        key identifying genotype of gene for FitnessCache, genes with equal keys must have equal fitness.
+        Override it to enable caching (e.g. tuple of the genotype).
+
+        :return: hashable key, None means gene is not cached.
+        """
+        return None
+
+    @classmethod
+    def calculate_fitness_batch(cls, genes: List['Gene']) -> List[float]:
+        """
+        calculate fitness of many genes at once.
+        Override it when fitness of a whole population can be calculated faster together (e.g. with numpy),
+        gene pools use it in place of calculate_fitness.
+
+        :param genes: list of genes.
+        :return: list of fitness in same order as genes.
+        """
+        return [i.calculate_fitness() for i in genes]
+
+    def encode(self) -> bytes:
+        """
+        encode gene into bytes, used to send genes between processes (e.g. migrants of islands).
+        Override it (with decode) for a compact encoding of genotype, default pickles the gene.
+
+        :return: encoded gene.
+        """
+        return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def decode(cls, data: bytes) -> 'Gene':
+        """
+        decode gene encoded by encode.
+
+        :param data: encoded gene.
+        :return: gene.
+        """
+        return pickle.loads(data)
+
 
 class OrderedGene:
     """ Crossover and Mutation function for ordered genes."""
@@ -66,28 +138,160 @@ class OrderedGene:
             :return: Two children gene of parent genes
             """
             x = random.randint(0, len(items))
-            child_a = parent_a[:x]
-            child_b = parent_b[:x]
-            for i in parent_b:
-                if i not in child_a:
-                    child_a.append(i)
-            for i in parent_a:
-                if i not in child_b:
-                    child_b.append(i)
+            child_a = list(parent_a[:x])
+            child_b = list(parent_b[:x])
+            # set of visited items keeps it linear in length of gene.
+            visited_a = set(child_a)
+            visited_b = set(child_b)
+            child_a.extend(i for i in parent_b if i not in visited_a)
+            child_b.extend(i for i in parent_a if i not in visited_b)
+            return child_a, child_b
+
+        @staticmethod
+        def order(parent_a: List, parent_b: List, items: List) -> (List, List):
+            """
+            order crossover (OX). copies a random slice of one parent and fills rest of positions, starting after
+            the slice, in order of other parent.
+
+            :param parent_a: First Parent gene
+            :param parent_b: Second Parent gene
+            :param items: List of items in a ordered genes.
+            :return: Two children gene of parent genes
+            """
+            length = len(items)
+            a, b = sorted(random.sample(range(length + 1), 2)) if length > 0 else (0, 0)
+
+            def make_child(p, q):
+                child = [None] * length
+                child[a:b] = p[a:b]
+                visited = set(child[a:b])
+                fill = [i for i in list(q[b:]) + list(q[:b]) if i not in visited]
+                positions = list(range(b, length)) + list(range(a))
+                for i, j in zip(positions, fill):
+                    child[i] = j
+                return child
+
+            return make_child(parent_a, parent_b), make_child(parent_b, parent_a)
+
+        @staticmethod
+        def partially_mapped(parent_a: List, parent_b: List, items: List) -> (List, List):
+            """
+            partially mapped crossover (PMX). copies a random slice of one parent and places items of other parent
+            at their own position, following mapping of the slice on conflicts.
+
+            :param parent_a: First Parent gene
+            :param parent_b: Second Parent gene
+            :param items: List of items in a ordered genes.
+            :return: Two children gene of parent genes
+            """
+            length = len(items)
+            a, b = sorted(random.sample(range(length + 1), 2)) if length > 0 else (0, 0)
+
+            def make_child(p, q):
+                child = list(q)
+                child[a:b] = p[a:b]
+                mapping = {p[i]: q[i] for i in range(a, b)}
+                for i in list(range(a)) + list(range(b, length)):
+                    x = q[i]
+                    # mapping is one to one, so every chain is walked once.
+                    while x in mapping:
+                        x = mapping[x]
+                    child[i] = x
+                return child
+
+            return make_child(parent_a, parent_b), make_child(parent_b, parent_a)
+
+        @staticmethod
+        def cycle(parent_a: List, parent_b: List, items: List) -> (List, List):
+            """
+            cycle crossover (CX). every item keeps position of one of the parents, alternate cycles of positions
+            are taken from alternate parents.
+
+            :param parent_a: First Parent gene
+            :param parent_b: Second Parent gene
+            :param items: List of items in a ordered genes.
+            :return: Two children gene of parent genes
+            """
+            length = len(items)
+            position_a = {j: i for i, j in enumerate(parent_a)}
+            child_a = [None] * length
+            child_b = [None] * length
+            visited = [False] * length
+            swap = False
+            for start in range(length):
+                if visited[start]:
+                    continue
+                i = start
+                while not visited[i]:
+                    visited[i] = True
+                    if swap:
+                        child_a[i], child_b[i] = parent_b[i], parent_a[i]
+                    else:
+                        child_a[i], child_b[i] = parent_a[i], parent_b[i]
+                    i = position_a[parent_b[i]]
+                swap = not swap
             return child_a, child_b
 
+        @staticmethod
+        def edge_recombination(parent_a: List, parent_b: List, items: List) -> (List, List):
+            """
+            edge recombination crossover (ERX). builds children from union of edges of both parents, always
+            moving to neighbour with fewest remaining edges.
+
+            :param parent_a: First Parent gene
+            :param parent_b: Second Parent gene
+            :param items: List of items in a ordered genes.
+            :return: Two children gene of parent genes
+            """
+            length = len(items)
+            if length == 0:
+                return [], []
+            edges = {}
+            for p in (parent_a, parent_b):
+                for i in range(length):
+                    edges.setdefault(p[i], set()).update((p[i - 1], p[(i + 1) % length]))
+            for i, j in edges.items():
+                j.discard(i)
+
+            def make_child(start):
+                neighbours = {i: set(j) for i, j in edges.items()}
+                # unvisited items with their position for O(1) removal.
+                unvisited = list(neighbours)
+                position = {j: i for i, j in enumerate(unvisited)}
+                child = []
+                x = start
+                while True:
+                    child.append(x)
+                    i = position.pop(x)
+                    last = unvisited.pop()
+                    if last != x:
+                        unvisited[i] = last
+                        position[last] = i
+                    for j in neighbours[x]:
+                        neighbours[j].discard(x)
+                    if not unvisited:
+                        return child
+                    if neighbours[x]:
+                        fewest = min(len(neighbours[j]) for j in neighbours[x])
+                        x = random.choice([j for j in neighbours[x] if len(neighbours[j]) == fewest])
+                    else:
+                        x = random.choice(unvisited)
+
+            return make_child(parent_a[0]), make_child(parent_b[0])
+
     class Mutate:
         @staticmethod
-        def single_swap(gene: List) -> None:
+        def single_swap(gene: List) -> (int, int):
             """
             Swap a random point of gene with another random part.
 
             :param gene: gene to be mutated.
-            :return: None
+            :return: swapped positions (for delta evaluation).
             """
             a = random.randint(0, len(gene) - 1)
             b = random.randint(0, len(gene) - 1)
             gene[a], gene[b] = gene[b], gene[a]
+            return a, b
 
 
 class Selection:
@@ -108,8 +312,10 @@ class Selection:
         selected = []
         for i in range(len(population)):
             p = int(round(fitness[i] * selection_size))
-            for j in range(p):
-                selected.append(population[i])
+            if p > 0:
+                selected.extend([population[i]] * min(p, selection_size - len(selected)))
+                if len(selected) >= selection_size:
+                    break
         while len(selected) < selection_size:
             selected.append(population[random.randint(0, len(population) - 1)])
         return selected[:selection_size]
@@ -124,17 +330,75 @@ class Selection:
         :param selection_size: size of population to be selected.
         :return: selected list of genes.
         """
+        # binary search on cumulative fitness, first gene whose cumulative fitness is more than x.
+        cumulative = list(accumulate(fitness))
+        last = len(population) - 1
         selected = []
         for j in range(selection_size):
-            x = random.random()
-            s = 0
-            for i in range(len(population)):
-                s += fitness[i]
-                if x < s:
-                    selected.append(population[i])
-                    break
-            else:
-                selected.append(population[-1])
+            i = bisect_right(cumulative, random.random())
+            selected.append(population[min(i, last)])
+        return selected
+
+    @staticmethod
+    def alias(population: List[Gene], fitness: List[float], selection_size: int) -> List[Gene]:
+        """
+        select a population of selection_size proportional to fitness with Walker's alias method.
+        table is built once in O(n) and every selection is O(1).
+
+        :param population: list of genes in population.
+        :param fitness: list of fitness of genes in same order of population (sum should be normalized to 1).
+        :param selection_size: size of population to be selected.
+        :return: selected list of genes.
+        """
+        n = len(population)
+        total = sum(fitness)
+        if total <= 0:
+            return [population[random.randrange(n)] for _ in range(selection_size)]
+        probability = [i * n / total for i in fitness]
+        alias = list(range(n))
+        small = [i for i in range(n) if probability[i] < 1]
+        large = [i for i in range(n) if probability[i] >= 1]
+        while small and large:
+            x = small.pop()
+            y = large[-1]
+            alias[x] = y
+            probability[y] -= 1 - probability[x]
+            if probability[y] < 1:
+                small.append(large.pop())
+        # left overs are 1 up to rounding error.
+        for i in small + large:
+            probability[i] = 1
+        selected = []
+        for j in range(selection_size):
+            i = random.randrange(n)
+            selected.append(population[i] if random.random() < probability[i] else population[alias[i]])
+        return selected
+
+    @staticmethod
+    def stochastic_universal(population: List[Gene], fitness: List[float], selection_size: int) -> List[Gene]:
+        """
+        select a population of selection_size with stochastic universal sampling, a roulette wheel spun once
+        with selection_size equally spaced pointers. selected genes are shuffled, so they can be paired for crossover.
+
+        :param population: list of genes in population.
+        :param fitness: list of fitness of genes in same order of population (sum should be normalized to 1).
+        :param selection_size: size of population to be selected.
+        :return: selected list of genes.
+        """
+        cumulative = list(accumulate(fitness))
+        if selection_size <= 0:
+            return []
+        step = cumulative[-1] / selection_size
+        pointer = random.random() * step
+        last = len(population) - 1
+        selected = []
+        i = 0
+        for j in range(selection_size):
+            while i < last and cumulative[i] <= pointer:
+                i += 1
+            selected.append(population[i])
+            pointer += step
+        random.shuffle(selected)
         return selected
 
     @staticmethod
@@ -186,8 +450,9 @@ class Selection:
             :return: selected list of genes.
             """
             selected = []
+            indices = range(len(population))
             for i in range(selection_size):
-                tournament_list = random.choices(list(range(len(population))), k=tournament_size)
+                tournament_list = random.choices(indices, k=tournament_size)
                 winner = population[tournament_list[0]]
                 max_fitness = fitness[tournament_list[0]]
                 for j in tournament_list:
@@ -199,10 +464,104 @@ class Selection:
 
         return tournament_inner
 
+    @staticmethod
+    def get_vectorized_tournament(tournament_size: int = 1) -> Callable[[List[Gene], List[float], int], List[Gene]]:
+        """
+        returns an tournament based selection function, drawing contestants of all tournaments at once with numpy.
+        same as get_tournament, contestants are drawn with replacement and last of the best contestants wins.
+        numpy generator is seeded from random, so random.seed makes it reproducible.
+
+        :param tournament_size: size of tournament. (1 means random selection.)
+        :return: selection function.
+        """
+
+        def vectorized_tournament_inner(population: List[Gene], fitness: List[float],
+                                        selection_size: int) -> List[Gene]:
+            """
+            select a population of selection_size with tournament on basis of fitness.
+
+            :param population: list of genes in population.
+            :param fitness: list of fitness of genes in same order of population (sum should be normalized to 1).
+            :param selection_size: size of population to be selected.
+            :return: selected list of genes.
+            """
+            rng = np.random.default_rng(random.getrandbits(64))
+            # (selection_size x tournament_size) matrix of contestants.
+            contestants = rng.integers(0, len(population), size=(selection_size, tournament_size))
+            contestant_fitness = np.asarray(fitness)[contestants]
+            # argmax finds first best, search reversed rows for last best.
+            last_best = tournament_size - 1 - np.argmax(contestant_fitness[:, ::-1], axis=1)
+            winners = contestants[np.arange(selection_size), last_best]
+            return [population[i] for i in winners.tolist()]
+
+        return vectorized_tournament_inner
+
+
+class LocalSearch:
+    """
+    Local improvement stage of GenePool (memetic algorithm): after evaluation, best offspring (top_k) and a random
+    fraction of the others are improved with Gene.local_search (or improve function).
+    """
+
+    def __init__(self, top_k: int = 0, fraction: float = 0.0,
+                 improve: Callable[[Gene, Optional[float]], Optional[float]] = None):
+        """
+        Create a local search stage.
+
+        :param top_k: number of best genes improved every generation.
+        :param fraction: fraction of population picked at random and improved every generation.
+        :param improve: function improving a gene in place given its fitness and returning new fitness
+         (None if not known), default is local_search of gene.
+        """
+        self.top_k = top_k
+        self.fraction = fraction
+        self.improve = improve
+
+    def choose(self, fitness: List[float]) -> List[int]:
+        """
+        choose positions of genes to improve.
+
+        :param fitness: (not normalized) fitness of population.
+        :return: sorted positions.
+        """
+        size = len(fitness)
+        chosen = set()
+        if self.top_k:
+            chosen.update(heapq.nlargest(self.top_k, range(size), key=fitness.__getitem__))
+        if self.fraction:
+            chosen.update(random.sample(range(size), min(size, round(self.fraction * size))))
+        return sorted(chosen)
+
+    def apply(self, population: List[Gene], fitness: List[Optional[float]]) -> List[int]:
+        """
+        improve chosen genes in place and update fitness in place (None where it is not known).
+
+        :param population: population.
+        :param fitness: (not normalized) fitness in same order of population.
+        :return: positions whose gene was improved.
+        """
+        # a gene selected many times is at many positions, it is improved once.
+        improved_fitness = {}
+        for i in self.choose(fitness):
+            gene = population[i]
+            if id(gene) not in improved_fitness:
+                if self.improve is None:
+                    improved_fitness[id(gene)] = gene.local_search(fitness[i])
+                else:
+                    improved_fitness[id(gene)] = self.improve(gene, fitness[i])
+        improved = []
+        for i, gene in enumerate(population):
+            if id(gene) in improved_fitness:
+                fitness[i] = improved_fitness[id(gene)]
+                improved.append(i)
+        return improved
+
 
 class GenePool:
     def __init__(self, gene_type: Gene, population_size: int, mutation_rate: float = 0.1, crossover_rate: float = 1,
-                 select_func: Callable[[List[Gene], List[float], int], List[Gene]] = Selection.roulette_wheel):
+                 select_func: Callable[[List[Gene], List[float], int], List[Gene]] = Selection.roulette_wheel,
+                 evaluator: Evaluator = None, population_backend: PermutationArray = None,
+                 fitness_cache: FitnessCache = None, profiler: Profiler = None, local_search: LocalSearch = None):
         """
         Create a gene pool.
 
@@ -211,14 +570,26 @@ class GenePool:
         :param mutation_rate: rate of mutation.
         :param crossover_rate: rate of crossover.
         :param select_func: function to select.
+        :param evaluator: evaluator used to calculate fitness (default is serial).
+        :param population_backend: compact storage for population (e.g. PermutationArray), None keeps genes as they are.
+        :param fitness_cache: cache of fitness by fitness_key of genes, None calculates fitness every time.
+        :param profiler: profiler recording time of every phase of generate, None disables instrumentation.
+        :param local_search: local improvement of offspring after evaluation (memetic algorithm), None disables it.
         """
         self.population_size = population_size
         self.population = []
         self.fitness = []
+        self.raw_fitness = []
+        self.dirty = []
         self.gene_type = gene_type
         self.mutation_rate = mutation_rate
         self.crossover_rate = crossover_rate
         self.select_func = select_func
+        self.evaluator = evaluator or SerialEvaluator()
+        self.population_backend = population_backend
+        self.fitness_cache = fitness_cache
+        self.profiler = profiler or NullProfiler()
+        self.local_search = local_search
 
     def initialize_population(self) -> None:
         """
@@ -229,8 +600,11 @@ class GenePool:
         self.population = []
         for i in range(self.population_size):
             self.population.append(self.gene_type.create_random())
+        if self.population_backend is not None:
+            self.population = self.population_backend.pack(self.population)
         # evaluate
-        self.fitness = GenePool.evaluate(self.population)
+        self.dirty = [True] * len(self.population)
+        self.fitness = self.evaluate(self.population)
 
     def generate(self) -> None:
         """
@@ -239,21 +613,54 @@ class GenePool:
         2. crossover
         3. mutate
         4. evaluate
+        5. local search (if enabled)
 
         :return: None
         """
+        profiler = self.profiler
+        profiler.start_generation(self)
         # selection
-        selected = self.select_func(self.population, self.fitness, self.population_size)
+        with profiler.phase('selection'):
+            selected = self.select_func(self.population, self.fitness, self.population_size)
 
         # crossover
-        new_population = self.crossover(selected)
+        with profiler.phase('crossover'):
+            new_population = self.crossover(selected)
+            # genes passed through crossover unchanged carry their fitness.
+            fitness_of = dict(zip(map(id, self.population), self.raw_fitness))
+            carried = [fitness_of.get(id(i)) for i in new_population]
+            if self.population_backend is not None:
+                new_population = self.population_backend.pack(new_population)
 
         # mutation
-        self.mutate(new_population)
+        with profiler.phase('mutation'):
+            self.mutate(new_population, carried)
+        self.dirty = [i is None for i in carried]
         self.population = new_population
 
         # evaluate
-        self.fitness = GenePool.evaluate(new_population)
+        with profiler.phase('evaluation'):
+            self.fitness = self.evaluate(new_population, carried)
+
+        # local search
+        if self.local_search is not None:
+            with profiler.phase('local_search'):
+                self.improve()
+        profiler.end_generation(self)
+
+    def improve(self) -> List[int]:
+        """
+        improve genes of population with local_search, fitness of improved genes is updated
+        (or calculated again if local search does not know it).
+
+        :return: positions of improved genes.
+        """
+        fitness = list(self.raw_fitness)
+        improved = self.local_search.apply(self.population, fitness)
+        if improved:
+            self.dirty = [dirty or i is None for dirty, i in zip(self.dirty, fitness)]
+            self.fitness = self.evaluate(self.population, fitness)
+        return improved
 
     def crossover(self, selected_population: List[Gene]) -> List[Gene]:
         """
@@ -276,32 +683,92 @@ class GenePool:
                 new_population.append(selected_population[i])
         return new_population
 
-    def mutate(self, crossed_population: List[Gene]) -> None:
+    def mutate(self, crossed_population: List[Gene], fitness: List[Optional[float]] = None) -> List[int]:
         """
         Mutate the population.
+        if fitness is given, genes with known fitness are mutated with mutate_incremental and fitness is updated
+        in place (None where fitness after mutation is not known).
 
         :param crossed_population: list of genes to mutate.
-        :return:
+        :param fitness: known fitness in same order of population, None for unknown.
+        :return: positions of mutated genes.
         """
-        for i in crossed_population:
+        mutated = []
+        # fitness of mutated genes after their last mutation, a gene selected many times is at many positions.
+        mutated_fitness = {}
+        for i, gene in enumerate(crossed_population):
             if random.random() <= self.mutation_rate:
-                i.mutate()
+                before = mutated_fitness.get(id(gene), fitness[i]) if fitness is not None else None
+                if before is None:
+                    gene.mutate()
+                    mutated_fitness[id(gene)] = None
+                else:
+                    mutated_fitness[id(gene)] = gene.mutate_incremental(before)
+                mutated.append(i)
+        if fitness is not None and mutated_fitness:
+            for i, gene in enumerate(crossed_population):
+                if id(gene) in mutated_fitness:
+                    fitness[i] = mutated_fitness[id(gene)]
+        return mutated
 
-    @staticmethod
-    def evaluate(population: List[Gene]) -> List[float]:
+    def evaluate(self, population: List[Gene], known_fitness: List[float] = None) -> List[float]:
         """
-        Evaluate the fitness of population.
+        Evaluate the fitness of population, fitness is calculated only for genes without known fitness.
+        (raw fitness is kept in raw_fitness.)
 
         :param population: population to evaluate
+        :param known_fitness: fitness already known in same order of population, None for unknown.
         :return: normalized fitness.
         """
-        fitness = []
-        for i in population:
-            fitness.append(i.calculate_fitness())
+        if known_fitness is None:
+            known_fitness = [None] * len(population)
+        self.profiler.count_evaluations(sum(i is None for i in known_fitness))
+        fitness = calculate_missing_fitness(population, known_fitness, self.gene_type, self.evaluator,
+                                            self.fitness_cache)
+        self.raw_fitness = fitness
         sum_fitness = sum(fitness)
         normalized_fitness = [i / sum_fitness for i in fitness]
         return normalized_fitness
 
+    def run(self, **kwargs) -> RunResult:
+        """
+        run headless until a stopping criterion is met, see Genetic.Runner.run for arguments
+        (generations, time_limit, stagnation, target, callbacks, ...).
+
+        :return: result of run.
+        """
+        return run(self, **kwargs)
+
+    def emigrate(self, count: int) -> (List[Gene], List[float]):
+        """
+        get best genes of population to send to other pools.
+
+        :param count: number of genes.
+        :return: best genes and their (not normalized) fitness.
+        """
+        best = sorted(range(len(self.population)), key=lambda i: self.raw_fitness[i], reverse=True)[:count]
+        return [self.population[i] for i in best], [self.raw_fitness[i] for i in best]
+
+    def immigrate(self, genes: List[Gene], fitness: List[float] = None) -> None:
+        """
+        replace worst genes of population with genes from other pools.
+
+        :param genes: list of genes.
+        :param fitness: their (not normalized) fitness, None to calculate it.
+        :return: None
+        """
+        worst = sorted(range(len(self.population)), key=lambda i: self.raw_fitness[i])[:len(genes)]
+        known = list(self.raw_fitness)
+        population = list(self.population)
+        for k, i in enumerate(worst):
+            population[i] = genes[k]
+            known[i] = fitness[k] if fitness is not None else None
+        if self.population_backend is not None:
+            population = self.population_backend.pack(population)
+        self.dirty = [i is None for i in known]
+        self.population = population
+        self.fitness = self.evaluate(population, known)
+
     def get_population(self) -> List[Gene]:
         """
         get population of current generation.
@@ -0,0 +1,257 @@
+"""
+Asynchronous steady-state evolution of a GenePool for slow fitness of varying cost.
+offspring are evaluated on the evaluator of pool one by one, and as soon as any evaluation finishes its gene
+is inserted into population and a new offspring is sent, so workers never wait for the slowest gene of a generation.
+
+    pool = GenePool(MyGene, 100, evaluator=ProcessPoolEvaluator(8))
+    result = SteadyState(pool).run(evaluations=10000)
+"""
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+
+from Genetic.Evaluators import get_fitness_func
+
+
+class SteadyStateResult:
+    """ Outcome of a steady-state run."""
+
+    def __init__(self, evaluations: int, inserted: int, elapsed: float, best_fitness: float, stop_reason: str):
+        """
+        Create a steady-state result.
+
+        :param evaluations: number of offspring evaluated.
+        :param inserted: number of offspring inserted into population.
+        :param elapsed: wall time in seconds.
+        :param best_fitness: best (not normalized) fitness in population.
+        :param stop_reason: 'evaluations', 'time_limit', 'target' or 'exhausted'.
+        """
+        self.evaluations = evaluations
+        self.inserted = inserted
+        self.elapsed = elapsed
+        self.best_fitness = best_fitness
+        self.stop_reason = stop_reason
+
+    def __repr__(self):
+        return "SteadyStateResult(evaluations={}, inserted={}, elapsed={:.3f}, best_fitness={}, stop_reason={!r})" \
+            .format(self.evaluations, self.inserted, self.elapsed, self.best_fitness, self.stop_reason)
+
+
+class SteadyState:
+    """
+    Steady-state driver of a GenePool. parents are picked with select_func of pool, offspring are made with
+    crossover and mutate of pool and evaluated with its evaluator (and fitness cache). an evaluated offspring
+    replaces the worst gene of population, or the loser of a random tournament, if it is not worse.
+    """
+
+    def __init__(self, pool, in_flight: Optional[int] = None, replacement: str = 'worst', tournament_size: int = 2,
+                 stall_limit: int = 1000):
+        """
+        Create a steady-state driver.
+
+        :param pool: GenePool.
+        :param in_flight: number of offspring evaluated at same time. (None means twice the workers of evaluator.)
+        :param replacement: 'worst' (replace worst gene) or 'tournament' (replace worst of tournament_size random genes).
+        :param tournament_size: size of tournament picking gene to replace.
+        :param stall_limit: without a time limit, stop after this many breeding rounds in a row found only cached
+         offspring (search space is exhausted).
+        """
+        if replacement not in ('worst', 'tournament'):
+            raise ValueError("unknown replacement: {}".format(replacement))
+        self.pool = pool
+        self.in_flight = in_flight or 2 * getattr(pool.evaluator, 'workers', 1)
+        self.replacement = replacement
+        self.tournament_size = tournament_size
+        self.stall_limit = stall_limit
+        self.fitness_func = get_fitness_func(pool.gene_type)
+        self.population = []
+        self.fitness = np.zeros(0)
+        self.normalized = None  # normalized fitness for select_func, None when population changed.
+        self.offspring = []  # bred offspring waiting to be sent.
+        self.genes = {}  # future -> gene being evaluated.
+        self.keys = Counter()  # fitness keys of population -> count, kept when pool has a fitness cache.
+        self.evaluations = 0
+        self.inserted = 0
+
+    def breed(self) -> None:
+        """
+        make offspring from two parents with select_func, crossover and mutate of pool.
+        offspring whose fitness is known (not crossed, or mutated incrementally) are inserted at once.
+
+        :return: None
+        """
+        pool = self.pool
+        if self.normalized is None:
+            self.normalized = (self.fitness / self.fitness.sum()).tolist()
+        parents = pool.select_func(self.population, self.normalized, 2)
+        children = pool.crossover(parents)
+        fitness_of = {id(self.population[i]): self.fitness[i] for i in range(len(self.population))}
+        known = []
+        for i, child in enumerate(children):
+            if id(child) in fitness_of:
+                # parents stay in population, so uncrossed children are copies.
+                known.append(float(fitness_of[id(child)]))
+                children[i] = pool.gene_type.decode(child.encode())
+            else:
+                known.append(None)
+        mutated = set(pool.mutate(children, known))
+        for i, (child, fitness) in enumerate(zip(children, known)):
+            if fitness is None:
+                self.offspring.append(child)
+            elif i in mutated:
+                self.insert(child, fitness)
+
+    def send(self, loop: asyncio.AbstractEventLoop) -> Optional[asyncio.Future]:
+        """
+        send next offspring to evaluator, offspring found in fitness cache are inserted without evaluation.
+
+        :param loop: event loop.
+        :return: future of list with fitness of offspring, None if budget of breeding was spent on cached offspring
+         (call it again to keep breeding).
+        """
+        cache = self.pool.fitness_cache
+        # bounded, so a converged population finding everything in cache does not loop forever.
+        for i in range(100):
+            if not self.offspring:
+                self.breed()
+                continue
+            child = self.offspring.pop()
+            if cache is not None:
+                fitness = cache.lookup(child)
+                if fitness is not None:
+                    # a genome already in population would only add a clone.
+                    if not self.keys.get(cache.key(child)):
+                        self.insert(child, fitness)
+                    continue
+            future = asyncio.wrap_future(self.pool.evaluator.submit(self.fitness_func, [child]), loop=loop)
+            self.genes[future] = child
+            return future
+        return None
+
+    def insert(self, gene, fitness: float) -> bool:
+        """
+        insert a gene in place of worst gene or tournament loser, if it is not worse.
+
+        :param gene: gene.
+        :param fitness: its (not normalized) fitness.
+        :return: if gene was inserted.
+        """
+        if self.replacement == 'worst':
+            loser = int(np.argmin(self.fitness))
+        else:
+            contestants = np.array(random.choices(range(len(self.population)), k=self.tournament_size))
+            loser = int(contestants[np.argmin(self.fitness[contestants])])
+        if fitness < self.fitness[loser]:
+            return False
+        cache = self.pool.fitness_cache
+        if cache is not None:
+            self.keys[cache.key(self.population[loser])] -= 1
+            self.keys[cache.key(gene)] += 1
+        self.population[loser] = gene
+        self.fitness[loser] = fitness
+        self.normalized = None
+        self.inserted += 1
+        return True
+
+    async def evolve(self, evaluations: Optional[int] = None, time_limit: Optional[float] = None,
+                     target: Optional[float] = None) -> SteadyStateResult:
+        """
+        evolve pool until one of the stopping criteria is met, keeping in_flight offspring in evaluation.
+        population, raw_fitness and fitness of pool are updated when it stops.
+
+        :param evaluations: maximum number of offspring evaluated.
+        :param time_limit: maximum wall time in seconds.
+        :param target: stop once best (not normalized) fitness reaches target.
+        :return: result of run.
+        """
+        if evaluations is None and time_limit is None and target is None:
+            raise ValueError("give at least one of evaluations, time_limit or target")
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        pool = self.pool
+        if not pool.population:
+            pool.initialize_population()
+        self.population = list(pool.population)
+        self.fitness = np.array(pool.raw_fitness, dtype=float)
+        self.normalized = None
+        cache = pool.fitness_cache
+        self.keys = Counter(cache.key(i) for i in self.population) if cache is not None else Counter()
+        pending = set()
+        sent = 0
+        stalls = 0  # breeding rounds in a row giving only cached offspring while nothing is in evaluation.
+        stop_reason = None
+        try:
+            while stop_reason is None:
+                if time_limit is not None and time.perf_counter() - start >= time_limit:
+                    stop_reason = 'time_limit'
+                    break
+                stalled = False
+                while len(pending) < self.in_flight and (evaluations is None or sent < evaluations):
+                    future = self.send(loop)
+                    if future is None:
+                        stalled = True
+                        break
+                    pending.add(future)
+                    sent += 1
+                if target is not None and self.fitness.max() >= target:
+                    stop_reason = 'target'
+                    break
+                if not pending:
+                    if evaluations is not None and sent >= evaluations:
+                        stop_reason = 'evaluations'
+                        break
+                    stalls = stalls + 1 if stalled else 0
+                    if time_limit is None and stalls >= self.stall_limit:
+                        # without a time limit, a search space found whole in cache would never stop.
+                        stop_reason = 'exhausted'
+                        break
+                    # keep breeding, giving other tasks a chance to run.
+                    await asyncio.sleep(0)
+                    continue
+                stalls = 0
+                timeout = None
+                if time_limit is not None:
+                    timeout = max(0.0, time_limit - (time.perf_counter() - start))
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    gene = self.genes.pop(future)
+                    fitness = future.result()[0]
+                    self.evaluations += 1
+                    if cache is not None:
+                        cache.store(gene, fitness)
+                    self.insert(gene, fitness)
+        finally:
+            for future in pending:
+                future.cancel()
+            self.genes.clear()
+            self.write_back()
+        return SteadyStateResult(self.evaluations, self.inserted, time.perf_counter() - start,
+                                 float(self.fitness.max()), stop_reason)
+
+    def write_back(self) -> None:
+        """
+        put population and fitness into pool.
+
+        :return: None
+        """
+        pool = self.pool
+        population = self.population
+        if pool.population_backend is not None:
+            population = pool.population_backend.pack(population)
+        pool.population = population
+        pool.dirty = [False] * len(population)
+        pool.fitness = pool.evaluate(population, self.fitness.tolist())
+
+    def run(self, evaluations: Optional[int] = None, time_limit: Optional[float] = None,
+            target: Optional[float] = None) -> SteadyStateResult:
+        """
+        run evolve in a new event loop, see evolve.
+
+        :return: result of run.
+        """
+        return asyncio.run(self.evolve(evaluations, time_limit, target))
+
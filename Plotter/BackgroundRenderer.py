@@ -0,0 +1,247 @@
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+import matplotlib.backends.backend_agg as agg
+import pygame
+
+from Plotter.PygamePlotter import get_fig_size
+
+matplotlib.use("Agg")
+
+
+class SnapshotQueue:
+    """ Queue holding only the latest snapshot, older snapshots not yet rendered are dropped (frame skipping)."""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=1)
+        self.dropped = 0
+
+    def put(self, snapshot: dict) -> None:
+        """
+        put a snapshot, replacing the one not yet taken. never blocks.
+
+        :param snapshot: snapshot of evolution (small data, like best tour or histogram bins).
+        :return: None
+        """
+        while True:
+            try:
+                self.queue.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float = None) -> dict:
+        """
+        take latest snapshot.
+
+        :param timeout: seconds to wait.
+        :return: snapshot, None if none arrived in time.
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LivePlot(ABC):
+    """
+    Matplotlib plot redrawn from snapshots by updating its artists (set_data) and blitting them over a cached
+    background. Axes, labels and ticks are drawn again only when data leaves current limits.
+    """
+
+    def __init__(self, pos, size, title: str = "", xlabel: str = "", ylabel: str = ""):
+        self.pos = pos
+        self.size = size
+        self.fig = Figure(figsize=get_fig_size(size))
+        self.ax = self.fig.add_subplot(111)
+        self.canvas = agg.FigureCanvasAgg(self.fig)
+        self.ax.set_title(title)
+        self.ax.set_xlabel(xlabel)
+        self.ax.set_ylabel(ylabel)
+        self.artists = self.create_artists()
+        for i in self.artists:
+            i.set_animated(True)
+        self.fig.tight_layout()
+        self.background = None
+
+    @abstractmethod
+    def create_artists(self) -> list:
+        """
+        create artists updated by every snapshot.
+
+        :return: list of artists.
+        """
+        pass
+
+    @abstractmethod
+    def update_artists(self, snapshot: dict) -> bool:
+        """
+        update artists from snapshot.
+
+        :param snapshot: snapshot.
+        :return: if limits of axes changed (background must be drawn again).
+        """
+        pass
+
+    @staticmethod
+    def expand(limits, low, high, margin: float = 0.1) -> (float, float):
+        """
+        get limits containing low and high, with a margin so limits do not change every frame.
+
+        :param limits: current limits.
+        :param low: lowest value.
+        :param high: highest value.
+        :param margin: fraction of range added on both sides when limits change.
+        :return: limits.
+        """
+        if limits[0] <= low and high <= limits[1]:
+            return limits
+        pad = (high - low) * margin or abs(high) * margin or 1
+        return low - pad, high + pad
+
+    def render(self, snapshot: dict) -> (bytes, (int, int)):
+        """
+        render snapshot into RGBA image.
+
+        :param snapshot: snapshot.
+        :return: image bytes and size.
+        """
+        if self.update_artists(snapshot) or self.background is None:
+            self.canvas.draw()  # animated artists are left out of background.
+            self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        else:
+            self.canvas.restore_region(self.background)
+        for i in self.artists:
+            self.ax.draw_artist(i)
+        return bytes(self.canvas.buffer_rgba()), self.canvas.get_width_height()
+
+
+class LinePlot(LivePlot):
+    """ Line of values of snapshot[key] against their index (starting from 1)."""
+
+    def __init__(self, pos, size, key: str, **kwargs):
+        self.key = key
+        super().__init__(pos, size, **kwargs)
+
+    def create_artists(self) -> list:
+        self.line, = self.ax.plot([], [])
+        return [self.line]
+
+    def update_artists(self, snapshot: dict) -> bool:
+        values = np.asarray(snapshot[self.key], dtype=float)
+        if len(values) == 0:
+            self.line.set_data([], [])
+            return False
+        self.line.set_data(np.arange(1, len(values) + 1), values)
+        x_limits = self.ax.get_xlim()
+        # x grows by doubling, so axes are redrawn only log(generations) times.
+        new_x = x_limits if len(values) <= x_limits[1] else (0, max(2 * len(values), 10))
+        new_y = self.expand(self.ax.get_ylim(), values.min(), values.max())
+        if new_x != x_limits or new_y != self.ax.get_ylim():
+            self.ax.set_xlim(*new_x)
+            self.ax.set_ylim(*new_y)
+            return True
+        return False
+
+
+class HistogramPlot(LivePlot):
+    """ Histogram from precomputed bins in snapshot[key] as (counts, edges), e.g. from numpy.histogram."""
+
+    def __init__(self, pos, size, key: str, **kwargs):
+        self.key = key
+        super().__init__(pos, size, **kwargs)
+
+    def create_artists(self) -> list:
+        self.steps = self.ax.stairs([0], [0, 1], fill=True)
+        return [self.steps]
+
+    def update_artists(self, snapshot: dict) -> bool:
+        counts, edges = snapshot[self.key]
+        self.steps.set_data(counts, edges)
+        new_x = self.expand(self.ax.get_xlim(), edges[0], edges[-1])
+        new_y = self.expand(self.ax.get_ylim(), 0, max(counts))
+        if new_x != self.ax.get_xlim() or new_y != self.ax.get_ylim():
+            self.ax.set_xlim(*new_x)
+            self.ax.set_ylim(0, new_y[1])
+            return True
+        return False
+
+
+class BackgroundRenderer(threading.Thread):
+    """
+    Renders plots from snapshots in a background thread at a capped frame rate, so evolution never waits for
+    matplotlib. The main (pygame) thread only blits the latest rendered images.
+    """
+
+    def __init__(self, plots: list, fps: float = 10):
+        """
+        Create a background renderer (call start to run it).
+
+        :param plots: list of LivePlot.
+        :param fps: maximum frames per second.
+        """
+        super().__init__(daemon=True)
+        self.plots = plots
+        self.interval = 1 / fps
+        self.snapshots = SnapshotQueue()
+        self.frames = {}
+        self.images = {}  # pygame images of latest frames, converted once per frame.
+        self.lock = threading.Lock()
+        self.running = True
+        self.rendered = 0
+
+    def submit(self, snapshot: dict) -> None:
+        """
+        submit a snapshot of evolution, never blocks.
+
+        :param snapshot: snapshot.
+        :return: None
+        """
+        self.snapshots.put(snapshot)
+
+    def run(self) -> None:
+        while self.running:
+            snapshot = self.snapshots.get(timeout=0.1)
+            if snapshot is None:
+                continue
+            start = time.perf_counter()
+            frames = {}
+            for plot in self.plots:
+                frames[plot] = plot.render(snapshot)
+            with self.lock:
+                self.frames = frames
+            self.rendered += 1
+            # snapshots arriving while waiting are skipped except the latest.
+            time.sleep(max(0.0, self.interval - (time.perf_counter() - start)))
+
+    def blit(self, screen) -> None:
+        """
+        draw latest rendered images of plots on screen.
+
+        :param screen: pygame surface.
+        :return: None
+        """
+        with self.lock:
+            frames, self.frames = self.frames, {}
+        for plot, (raw_data, size) in frames.items():
+            self.images[plot] = pygame.image.frombuffer(raw_data, size, "RGBA")
+        for plot, img in self.images.items():
+            screen.blit(img, (plot.pos[0], plot.pos[1]))
+
+    def stop(self) -> None:
+        """
+        stop rendering thread.
+
+        :return: None
+        """
+        self.running = False
+        self.join()
@@ -27,8 +27,7 @@ class Plotter:
     def show(self):
         self.fig.tight_layout()
         self.canvas.draw()
-        renderer = self.canvas.get_renderer()
-        raw_data = renderer.tostring_rgb()
+        raw_data = self.canvas.buffer_rgba()
         size = self.canvas.get_width_height()
-        img = pygame.image.fromstring(raw_data, size, "RGB")
+        img = pygame.image.frombuffer(raw_data, size, "RGBA")
         self.screen.blit(img, (self.pos[0], self.pos[1]))
@@ -0,0 +1,45 @@
+import os
+import random
+import tempfile
+import unittest
+
+from Example_Schaffers_Study.Schaffer import get_schaffer_pool
+from Example_TSP.TSP import get_random_tsp_pool
+from Genetic.Checkpoint import load_checkpoint, save_checkpoint
+from Genetic.Runner import get_score
+
+
+def get_state(pool):
+    if hasattr(pool, 'wrappers'):
+        return [(i.gene.encode(), i.fitness, i.rank, i.cDist) for i in pool.wrappers]
+    return [(i.encode(), j) for i, j in zip(pool.population, pool.raw_fitness)]
+
+
+class TestCheckpoint(unittest.TestCase):
+    def assert_resume_matches(self, make_pool):
+        random.seed(1)
+        pool = make_pool()
+        pool.initialize_population()
+        for i in range(5):
+            pool.generate()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'pool.npz')
+            save_checkpoint(pool, path, 5)
+            for i in range(5):
+                pool.generate()
+            resumed = make_pool()
+            self.assertEqual(load_checkpoint(resumed, path), 5)
+        for i in range(5):
+            resumed.generate()
+        self.assertEqual(get_state(resumed), get_state(pool))
+        self.assertEqual(get_score(resumed), get_score(pool))
+
+    def test_gene_pool_resume(self):
+        self.assert_resume_matches(lambda: get_random_tsp_pool(40, 20))
+
+    def test_non_dominated_gene_pool_resume(self):
+        self.assert_resume_matches(lambda: get_schaffer_pool(40))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import functools
+import os
+import signal
+import unittest
+
+from Example_TSP.TSP import get_random_tsp_pool
+from Genetic.Evaluators import ProcessPoolEvaluator
+from Genetic.Islands import IslandModel
+
+
+def get_pool_with_process_evaluator():
+    pool = get_random_tsp_pool(30, 15)
+    pool.evaluator = ProcessPoolEvaluator(2)
+    return pool
+
+
+def get_killed_pool():
+    pool = get_random_tsp_pool(30, 15)
+    # worker dies without posting an error, as when it is killed for memory.
+    pool.generate = lambda: os.kill(os.getpid(), signal.SIGKILL)
+    return pool
+
+
+class TestIslandModel(unittest.TestCase):
+    def test_inline_matches_processes(self):
+        factory = functools.partial(get_random_tsp_pool, 30, 15)
+        inline = IslandModel(factory, 3, 5, 2, 'random', seed=1, processes=False).run(20)
+        processes = IslandModel(factory, 3, 5, 2, 'random', seed=1, processes=True).run(20)
+        self.assertEqual([[list(i.order) for i in genes] for genes, fitness in inline],
+                         [[list(i.order) for i in genes] for genes, fitness in processes])
+        self.assertEqual([fitness for genes, fitness in inline], [fitness for genes, fitness in processes])
+
+    def test_island_with_process_evaluator(self):
+        results = IslandModel(get_pool_with_process_evaluator, 2, 2, 1, seed=1).run(4)
+        self.assertEqual(len(results), 2)
+
+    def test_dead_worker_is_reported(self):
+        with self.assertRaisesRegex(RuntimeError, 'died'):
+            IslandModel(get_killed_pool, 2, 2, 1, seed=1).run(4)
+
+
+if __name__ == '__main__':
+    unittest.main()
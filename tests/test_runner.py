@@ -0,0 +1,25 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from Genetic.Runner import main
+
+
+class TestResume(unittest.TestCase):
+    def test_resume_continues_generation_budget(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.npz')
+            arguments = ['Example_TSP.TSP:get_random_tsp_pool', '-a', 'population_size=20', '-a', 'city_count=10',
+                         '--log-interval', '0', '--checkpoint', path, '--checkpoint-interval', '5', '--seed', '1']
+            self.assertEqual(main(arguments + ['--generations', '20']).generations, 20)
+            result = main(arguments + ['--generations', '30', '--resume'])
+            self.assertEqual(result.generations, 30)
+            self.assertEqual(len(result.history), 10)
+            with np.load(path) as checkpoint:
+                self.assertEqual(int(checkpoint['generation']), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
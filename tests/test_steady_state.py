@@ -0,0 +1,35 @@
+import random
+import unittest
+
+from Example_TSP.TSP import get_random_tsp_pool
+from Genetic.Evaluators import FitnessCache
+from Genetic.SteadyState import SteadyState
+
+
+def get_cached_pool():
+    random.seed(0)
+    pool = get_random_tsp_pool(100, 30)
+    pool.fitness_cache = FitnessCache(1000)
+    return pool
+
+
+class TestSteadyStateWithCache(unittest.TestCase):
+    def test_time_limit_is_respected(self):
+        result = SteadyState(get_cached_pool()).run(time_limit=0.5)
+        self.assertEqual(result.stop_reason, 'time_limit')
+        self.assertGreaterEqual(result.elapsed, 0.5)
+
+    def test_evaluations_are_respected(self):
+        result = SteadyState(get_cached_pool()).run(evaluations=2000)
+        self.assertEqual(result.stop_reason, 'evaluations')
+        self.assertEqual(result.evaluations, 2000)
+
+    def test_cache_hits_add_no_clones(self):
+        pool = get_cached_pool()
+        SteadyState(pool).run(evaluations=1000)
+        # mutated copies of parents may still match a genome, but cache hits must not fill population with clones.
+        self.assertGreater(len({tuple(i.order) for i in pool.population}), 0.9 * len(pool.population))
+
+
+if __name__ == '__main__':
+    unittest.main()